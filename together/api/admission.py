@@ -0,0 +1,128 @@
+import threading
+import time
+
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .meta import meta_base
+from .metrics import Counter, Gauge, Histogram
+
+
+"""
+Admission control
+
+Purpose:
+    Limit the GraphQL executions running at the same time in a process, so a spike queues up in front
+    of the view instead of opening a DB connection and running a heavy query per worker thread at once.
+
+    Requests are sorted into cost classes by their static cost (api.cost), GRAPHQL_ADMISSION_CLASSES
+    sets the highest cost and the number of in-flight executions of each class. Requests over the limit
+    wait in a queue of at most GRAPHQL_ADMISSION_QUEUE_SIZE requests per class.
+
+    The wait counts against GRAPHQL_TIMEOUT. A request is shed (Overloaded, a 503 in api.views) when its
+    queue is full or when less than GRAPHQL_ADMISSION_MIN_BUDGET ms of its budget would be left to execute,
+    it would only time out after taking a slot.
+"""
+
+admission_queue_depth = Gauge('graphql_admission_queue_depth', 'Requests waiting for admission.', ('cost_class',))
+admission_wait = Histogram(
+    'graphql_admission_wait_seconds',
+    'Time requests waited for admission.',
+    ('cost_class',),
+    buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+admission_shed_total = Counter('graphql_admission_shed_total', 'Requests shed by the admission control.', ('cost_class', 'reason'))
+
+
+class Overloaded(Exception):
+
+    def __init__(self, cost_class, reason):
+        super().__init__(f"The server is overloaded ({cost_class} requests), retry later.")
+        self.cost_class = cost_class
+        self.reason = reason
+
+
+class CostClass:
+    """In-flight executions and waiting requests of a single cost class."""
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    def _shed(self, reason, started):
+        admission_shed_total.inc(self.name, reason)
+        admission_wait.observe(time.monotonic() - started, self.name)
+        raise Overloaded(self.name, reason)
+
+    def acquire(self):
+        started = time.monotonic()
+
+        with self._condition:
+            if self.in_flight < self.limit:
+                self.in_flight += 1
+                admission_wait.observe(0, self.name)
+                return
+
+            if self.waiting >= settings.GRAPHQL_ADMISSION_QUEUE_SIZE:
+                self._shed('queue_full', started)
+
+            self.waiting += 1
+            admission_queue_depth.inc(self.name)
+            try:
+                while self.in_flight >= self.limit:
+                    timeout = (meta_base.remaining_time() - settings.GRAPHQL_ADMISSION_MIN_BUDGET) / 1000
+                    if timeout <= 0 or not self._condition.wait(timeout):
+                        if self.in_flight >= self.limit:
+                            self._shed('deadline', started)
+                self.in_flight += 1
+            finally:
+                self.waiting -= 1
+                admission_queue_depth.dec(self.name)
+
+        admission_wait.observe(time.monotonic() - started, self.name)
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+
+class AdmissionController:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._classes = {}
+
+    def cost_class(self, cost):
+        """Name of the first class of GRAPHQL_ADMISSION_CLASSES whose `max_cost` the cost doesn't exceed."""
+        for name, options in settings.GRAPHQL_ADMISSION_CLASSES.items():
+            if options['max_cost'] is None or cost <= options['max_cost']:
+                return name
+        return name
+
+    def _get(self, name):
+        with self._lock:
+            if name not in self._classes:
+                self._classes[name] = CostClass(name, settings.GRAPHQL_ADMISSION_CLASSES[name]['limit'])
+            return self._classes[name]
+
+    @contextmanager
+    def admit(self, cost):
+        """Execute the block once a slot of the cost class is free, raise Overloaded when the request is shed."""
+        cost_class = self._get(self.cost_class(cost))
+        cost_class.acquire()
+        try:
+            yield
+        finally:
+            cost_class.release()
+
+
+admission_controller = AdmissionController()
+
+
+def admission_enabled():
+    return settings.GRAPHQL_ADMISSION
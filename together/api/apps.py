@@ -0,0 +1,16 @@
+from django.apps import AppConfig
+from django.conf import settings
+from django.core import checks
+from django.db.backends.signals import connection_created
+
+
+class ApiConfig(AppConfig):
+    name = 'api'
+
+    def ready(self):
+        from .idempotency import check_idempotency_cache
+        checks.register(check_idempotency_cache)
+
+        if settings.GRAPHQL_RESPONSE_CACHE or settings.GRAPHQL_ETAGS:
+            from .cache import install_table_write_wrapper
+            connection_created.connect(install_table_write_wrapper, dispatch_uid='api_table_write_wrapper')
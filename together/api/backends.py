@@ -0,0 +1,48 @@
+import threading
+
+from collections import OrderedDict
+
+from django.conf import settings
+from graphql.backend import GraphQLCoreBackend
+from graphql.backend.cache import GraphQLCachedBackend
+
+
+class DocumentCacheBackend(GraphQLCachedBackend):
+    """
+    graphql-core backend keeping the GRAPHQL_DOCUMENT_CACHE_SIZE most recently used parsed documents.
+
+    Shared by all requests of the process, so repeated documents (app start batches, polling clients)
+    are parsed once.
+    """
+
+    def __init__(self, backend=None):
+        super().__init__(backend or GraphQLCoreBackend(), cache_map=OrderedDict())
+        self._lock = threading.Lock()
+
+    def document_from_string(self, schema, request_string):
+        key = self.get_key_for_schema_and_document_string(schema, request_string)
+
+        with self._lock:
+            document = self.cache_map.get(key)
+            if document is not None:
+                self.cache_map.move_to_end(key)
+                return document
+
+        document = self.backend.document_from_string(schema, request_string)
+
+        with self._lock:
+            self.cache_map[key] = document
+            while len(self.cache_map) > settings.GRAPHQL_DOCUMENT_CACHE_SIZE:
+                self.cache_map.popitem(last=False)
+
+        return document
+
+
+_document_backend = None
+
+
+def get_document_backend():
+    global _document_backend
+    if _document_backend is None:
+        _document_backend = DocumentCacheBackend()
+    return _document_backend
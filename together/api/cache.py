@@ -0,0 +1,264 @@
+import hashlib
+import json
+import re
+import threading
+import time
+
+from functools import partial
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from graphene.types.resolver import attr_resolver, dict_or_attr_resolver, dict_resolver
+from graphene_django.types import DjangoObjectType
+from graphql.language import ast
+from graphql.type import GraphQLList, GraphQLNonNull, GraphQLObjectType
+from graphql.utils.get_operation_ast import get_operation_ast
+
+from .meta import meta_base
+from .metrics import cache_requests_total
+from .types import BaseType
+
+from utils.string import camel_to_snake
+
+
+"""
+Response cache
+
+Purpose:
+    Cache the `data` of error-free GraphQL query responses, keyed by the document, the variables,
+    the operation name and the user scope (`cache_scope`), so users never share entries.
+
+    Every entry stores the version of each DB table its SQL read. The versions are per table
+    counters in the cache, bumped by TableWriteWrapper whenever a statement writes the table
+    (after the transaction commits). An entry is only served while all its versions are current.
+    The versions are read right before a table is first queried, a write committing meanwhile
+    leaves the entry with an outdated version, never with outdated data.
+
+    GRAPHQL_RESPONSE_CACHE requires a cache shared by all processes (CACHES[GRAPHQL_RESPONSE_CACHE_ALIAS]),
+    the write wrapper is installed on every connection by api.apps.ApiConfig.
+
+    GRAPHQL_ETAGS uses the same table versions for ETags of GET queries (`query_etag`), with the tables
+    derived from the selection before execution (`plan_tables`).
+"""
+
+WRITE_STATEMENTS = {'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'TRUNCATE'}
+
+_quoted_identifier = re.compile(r'["`]([^"`]+)["`]')
+_db_tables = None
+
+
+def get_cache():
+    return caches[settings.GRAPHQL_RESPONSE_CACHE_ALIAS]
+
+
+def db_tables():
+    """Tables of all installed models, including auto created m2m tables."""
+    global _db_tables
+    if _db_tables is None:
+        _db_tables = frozenset(model._meta.db_table for model in apps.get_models(include_auto_created=True))
+    return _db_tables
+
+
+def statement_tables(sql):
+    return db_tables().intersection(_quoted_identifier.findall(sql))
+
+
+def _version_key(table):
+    return f'graphql:table:{table}'
+
+
+def table_versions(tables):
+    """Current version of each table. Missing (evicted) versions are replaced by a new unique one."""
+    cache = get_cache()
+    keys = {_version_key(table): table for table in tables}
+    versions = cache.get_many(keys)
+
+    for key in keys.keys() - versions.keys():
+        cache.add(key, time.time_ns())
+        versions[key] = cache.get(key)
+
+    return {table: versions[key] for key, table in keys.items()}
+
+
+def bump_tables(tables):
+    cache = get_cache()
+    for table in tables:
+        try:
+            cache.incr(_version_key(table))
+        except ValueError:  # no version yet, entries can't refer to it
+            cache.add(_version_key(table), time.time_ns())
+
+
+class TableWriteWrapper:
+    """Execute wrapper bumping the version of every table a statement writes, once the write is committed."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+
+        if (sql.lstrip()[:8].split(None, 1) or [''])[0].upper() in WRITE_STATEMENTS:  # blank statements have no keyword
+            tables = statement_tables(sql)
+            if tables:
+                self.connection.on_commit(lambda: bump_tables(tables))  # runs right away in autocommit
+
+        return result
+
+
+def install_table_write_wrapper(sender, connection, **kwargs):
+    """connection_created receiver."""
+    if not any(isinstance(wrapper, TableWriteWrapper) for wrapper in connection.execute_wrappers):
+        # below the wrappers of active execute_wrapper() blocks, they pop the last entry on exit
+        connection.execute_wrappers.insert(0, TableWriteWrapper(connection))
+
+
+def cache_scope(user):
+    """Users only share cache entries with themselves, anonymous users with each other."""
+    if getattr(user, 'is_authenticated', False):
+        return f'user:{user.pk}'
+    return 'anonymous'
+
+
+def response_cache_key(query, variables, operation_name, scope):
+    key = json.dumps([query, variables or {}, operation_name, scope], sort_keys=True, cls=DjangoJSONEncoder)
+    return 'graphql:response:' + hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class TableRecorder:
+    """Statement listener collecting the versions of the tables read by the request."""
+
+    def __init__(self):
+        self._lock = threading.Lock()  # root fields can resolve in parallel, see api.executors
+        self.versions = {}
+
+    def record_statement(self, sql):
+        with self._lock:
+            tables = statement_tables(sql) - self.versions.keys()
+        if tables:
+            versions = table_versions(tables)
+            with self._lock:
+                for table, version in versions.items():
+                    self.versions.setdefault(table, version)
+
+
+def get_cached_data(key):
+    """Return the cached `data` of the key, None on a miss or when a table changed since."""
+    entry = get_cache().get(key)
+
+    if entry is not None and table_versions(entry['versions']) == entry['versions']:
+        cache_requests_total.inc('hit')
+        return entry['data']
+
+    cache_requests_total.inc('miss')
+    return None
+
+
+def start_table_recorder():
+    recorder = TableRecorder()
+    meta_base.add_statement_listener(recorder.record_statement)
+    return recorder
+
+
+def stop_table_recorder(recorder):
+    meta_base.get_statement_listeners().remove(recorder.record_statement)
+
+
+def set_cached_data(key, data, recorder):
+    get_cache().set(key, {'data': data, 'versions': dict(recorder.versions)}, settings.GRAPHQL_RESPONSE_CACHE_TIMEOUT)
+
+
+class _UnknownTables(Exception):
+    pass
+
+
+def _unwrap(graphql_type):
+    while isinstance(graphql_type, (GraphQLList, GraphQLNonNull)):
+        graphql_type = graphql_type.of_type
+    return graphql_type
+
+
+def _is_generated_resolver(resolver):
+    """Whether the resolver is a default one of graphene or the registry, reading only its own relation."""
+    if isinstance(resolver, partial):
+        resolver = resolver.func
+    return (
+        resolver in (None, attr_resolver, dict_or_attr_resolver, dict_resolver, DjangoObjectType.resolve_id)
+        or hasattr(resolver, 'attribute')  # api.factories.getattr_resolver_factory
+        or hasattr(resolver, 'node_type')  # api.factories.qs_resolver_factory
+    )
+
+
+def plan_tables(schema, document_ast, operation_name=None):
+    """
+    Tables a query operation reads, judging by its selection. None if they can't be told.
+
+    Every object type of the selection has to be a model type, the tables are those of the models
+    and the m2m tables of the selected m2m fields. Fields with a custom resolver or a `djangoFilter`
+    argument (its lookups can span any relation) can read other tables, they make the tables unknown.
+    """
+    operation = get_operation_ast(document_ast, operation_name)
+    if operation is None or operation.operation != 'query':
+        return None
+
+    fragments = {d.name.value: d for d in document_ast.definitions if isinstance(d, ast.FragmentDefinition)}
+    tables = set()
+
+    def _walk(object_type, selection_set):
+        NodeType = getattr(object_type, 'graphene_type', None)
+        Model = NodeType.Meta.model if isinstance(NodeType, type) and issubclass(NodeType, BaseType) else None
+
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.FragmentSpread):
+                if selection.name.value not in fragments:
+                    raise _UnknownTables()
+                _walk(object_type, fragments[selection.name.value].selection_set)
+                continue
+            if isinstance(selection, ast.InlineFragment):
+                _walk(object_type, selection.selection_set)
+                continue
+
+            name = selection.name.value
+            if name.startswith('__'):
+                continue
+            if name not in object_type.fields:
+                raise _UnknownTables()
+            if not _is_generated_resolver(object_type.fields[name].resolver):
+                raise _UnknownTables()
+            if any(argument.name.value == 'djangoFilter' for argument in selection.arguments or ()):
+                raise _UnknownTables()
+
+            field_type = _unwrap(object_type.fields[name].type)
+            if not isinstance(field_type, GraphQLObjectType):
+                continue
+
+            FieldType = getattr(field_type, 'graphene_type', None)
+            if not (isinstance(FieldType, type) and issubclass(FieldType, BaseType)):
+                raise _UnknownTables()  # custom node, its resolver can read anything
+            tables.add(FieldType.Meta.model._meta.db_table)
+
+            if Model is not None:
+                try:
+                    model_field = Model._meta.get_field(NodeType.alias_to_attribute(camel_to_snake(name)))
+                except FieldDoesNotExist:
+                    model_field = None
+                if model_field is not None and model_field.many_to_many:
+                    through = model_field.remote_field.through if model_field.concrete else model_field.through
+                    tables.add(through._meta.db_table)
+
+            if selection.selection_set:
+                _walk(field_type, selection.selection_set)
+
+    try:
+        _walk(schema.get_query_type(), operation.selection_set)
+    except _UnknownTables:
+        return None
+    return tables
+
+
+def query_etag(query, variables, operation_name, scope, versions):
+    key = json.dumps([query, variables or {}, operation_name, scope, sorted(versions.items())], sort_keys=True, cls=DjangoJSONEncoder)
+    return '"' + hashlib.sha256(key.encode('utf-8')).hexdigest()[:32] + '"'
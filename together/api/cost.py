@@ -0,0 +1,85 @@
+from django.conf import settings
+from graphql.execution.values import get_argument_values
+from graphql.language import ast
+from graphql.type import GraphQLList, GraphQLNonNull, GraphQLObjectType
+from graphql.utils.get_operation_ast import get_operation_ast
+
+
+"""
+Query cost
+
+Purpose:
+    Static cost of an operation computed from its document before execution, used by api.ratelimit.
+
+    Every object field (a resolver doing work, a query most of the time) costs 1 per parent object,
+    scalar fields are free. The sub-selection of a list field is multiplied by the expected list size:
+    the `limitTo` of its pagination argument (at most GRAPHQL_COST_MAX_LIST_SIZE), the number of `ids`
+    requested or GRAPHQL_COST_LIST_SIZE.
+"""
+
+
+def _unwrap(graphql_type):
+    is_list = False
+    while isinstance(graphql_type, (GraphQLList, GraphQLNonNull)):
+        is_list = is_list or isinstance(graphql_type, GraphQLList)
+        graphql_type = graphql_type.of_type
+    return graphql_type, is_list
+
+
+def _list_size(field_def, field_ast, variables):
+    """Expected number of items of a list field, judging by its pagination or id arguments."""
+    try:
+        arguments = get_argument_values(field_def.args, field_ast.arguments, variables)
+    except Exception:
+        arguments = {}  # reported by the validation
+
+    for value in arguments.values():
+        if isinstance(value, dict) and value.get('limit_to'):
+            return min(int(value['limit_to']), settings.GRAPHQL_COST_MAX_LIST_SIZE)
+    if isinstance(arguments.get('ids'), list):
+        return len(arguments['ids'])
+    return settings.GRAPHQL_COST_LIST_SIZE
+
+
+def query_cost(schema, document_ast, operation_name=None, variables=None):
+    """Cost of the operation, mutations are charged like queries of their payload plus GRAPHQL_COST_MUTATION."""
+    operation = get_operation_ast(document_ast, operation_name)
+    if operation is None:
+        return 0
+
+    fragments = {d.name.value: d for d in document_ast.definitions if isinstance(d, ast.FragmentDefinition)}
+    variables = variables or {}
+
+    def _cost(object_type, selection_set, multiplier, visited):
+        cost = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.FragmentSpread):
+                name = selection.name.value
+                if name in fragments and name not in visited:
+                    cost += _cost(object_type, fragments[name].selection_set, multiplier, visited | {name})
+                continue
+            if isinstance(selection, ast.InlineFragment):
+                cost += _cost(object_type, selection.selection_set, multiplier, visited)
+                continue
+
+            field_def = getattr(object_type, 'fields', {}).get(selection.name.value)
+            if field_def is None:
+                continue  # __typename, unknown fields are reported by the validation
+
+            field_type, is_list = _unwrap(field_def.type)
+            if not isinstance(field_type, GraphQLObjectType) or not selection.selection_set:
+                continue
+
+            cost += multiplier
+            size = _list_size(field_def, selection, variables) if is_list else 1
+            cost += _cost(field_type, selection.selection_set, multiplier * size, visited)
+        return cost
+
+    if operation.operation == 'mutation':
+        root_type, cost = schema.get_mutation_type(), settings.GRAPHQL_COST_MUTATION
+    else:
+        root_type, cost = schema.get_query_type(), 0
+
+    if root_type is None:
+        return cost
+    return cost + _cost(root_type, operation.selection_set, 1, frozenset())
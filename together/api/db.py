@@ -0,0 +1,136 @@
+import time
+
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import OperationalError, connections
+
+from .exceptions import TimeoutExit
+from .meta import meta_base
+
+
+"""
+Request queries
+
+Purpose:
+    1) MetaBase.abort_request_if_timedout only fires between resolvers, a single slow SQL
+       statement would run to completion long past GRAPHQL_TIMEOUT. The execute wrapper
+       below hands the remaining request budget to the database with every statement
+       and translates the database cancellation back into a TimeoutExit.
+
+       postgresql: statement_timeout (SET LOCAL inside transactions, session SET otherwise)
+       sqlite: progress handler interrupting the running statement
+
+    2) report every executed statement and its duration to the query observers
+       registered on the request (MetaBase.add_query_observer), statement listeners
+       (MetaBase.add_statement_listener) are told about the statement before it runs
+"""
+
+QUERY_CANCELED = '57014'  # postgresql error code of a statement cancelled by statement_timeout
+SQLITE_INTERRUPTED = 'interrupted'
+SQLITE_PROGRESS_OPCODES = 1000  # how many VM instructions sqlite runs between deadline checks
+
+
+class RequestQueryWrapper:
+    """
+    Execute wrapper limiting each statement to the remaining request budget and reporting it to query observers.
+
+    Outside of transactions the session statement_timeout is only re-sent when the budget
+    shrank by more than GRAPHQL_STATEMENT_TIMEOUT_SLACK since the last SET, to save a round
+    trip per statement. The session value is reset when the deadline is closed.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._session_timeout = None  # remaining budget last sent to the db
+        self._progress_handler_connection = None
+
+    def __call__(self, execute, sql, params, many, context):
+        remaining = int(meta_base.remaining_time())
+
+        if remaining <= 0:
+            raise TimeoutExit()
+
+        if self.connection.vendor == 'postgresql':
+            self._set_statement_timeout(context['cursor'].cursor, remaining)
+        elif self.connection.vendor == 'sqlite':
+            self._set_progress_handler()
+
+        for listener in meta_base.get_statement_listeners():
+            listener(sql)
+
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError as e:
+            if self._is_cancellation(e):
+                raise TimeoutExit() from e
+            raise
+        finally:
+            duration = (time.perf_counter() - start) * 1000
+            for observer in meta_base.get_query_observers():
+                observer(sql, duration)
+
+    def _set_statement_timeout(self, cursor, remaining):
+        # `cursor` is the raw DB-API cursor, going through the Django wrapper would recurse into this wrapper
+        if self.connection.in_atomic_block:
+            cursor.execute('SET LOCAL statement_timeout = %s', [remaining])
+            return
+
+        # the session value limits every statement, it must not outlast the deadline by more than the slack
+        if self._session_timeout is not None and self._session_timeout - remaining <= settings.GRAPHQL_STATEMENT_TIMEOUT_SLACK:
+            return
+
+        cursor.execute('SET statement_timeout = %s', [remaining])
+        self._session_timeout = remaining
+
+    def _set_progress_handler(self):
+        raw_connection = self.connection.connection
+
+        if self._progress_handler_connection is raw_connection:
+            return
+
+        def _interrupt_if_timedout():
+            return meta_base.remaining_time() <= 0  # truthy return value makes sqlite interrupt the statement
+
+        raw_connection.set_progress_handler(_interrupt_if_timedout, SQLITE_PROGRESS_OPCODES)
+        self._progress_handler_connection = raw_connection
+
+    def _is_cancellation(self, error):
+        cause = error.__cause__
+        if self.connection.vendor == 'postgresql':
+            return getattr(cause, 'pgcode', None) == QUERY_CANCELED
+        if self.connection.vendor == 'sqlite':
+            return SQLITE_INTERRUPTED in str(cause or error)
+        return False
+
+    def close(self):
+        """Restore the connection so queries outside of the request aren't limited."""
+        raw_connection = self.connection.connection
+
+        if raw_connection is None:
+            return
+
+        if self._progress_handler_connection is raw_connection:
+            raw_connection.set_progress_handler(None, 0)
+
+        if self._session_timeout is not None:
+            try:
+                with raw_connection.cursor() as cursor:
+                    cursor.execute('SET statement_timeout = DEFAULT')
+            except self.connection.Database.Error:
+                pass  # a broken connection gets discarded by Django anyway
+
+        self._progress_handler_connection = None
+        self._session_timeout = None
+
+
+@contextmanager
+def request_queries():
+    """Install the RequestQueryWrapper on every connection of the current thread within the block."""
+    with ExitStack() as stack:
+        for connection in connections.all():
+            wrapper = RequestQueryWrapper(connection)
+            stack.callback(wrapper.close)
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        yield
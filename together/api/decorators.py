@@ -1,17 +1,15 @@
 
-import time
-
-from .meta import MetaBase
+from .metering import count_rows, metered
 
 
 def billable(key):
+    """Meter wall time, SQL and returned rows of the function under `key`, see api.metering."""
     def _billable(function):
 
         def __billable(*args, **kwargs):
-            start_time = time.time()
-            out = function(*args, **kwargs)
-            execution_time = (time.time() - start_time) * 1000
-            MetaBase().add_billable(key, execution_time)
+            with metered(key) as meter:
+                out = function(*args, **kwargs)
+                meter.rows = count_rows(out)
             return out
 
         return __billable
@@ -0,0 +1,54 @@
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+"""
+Response encoders
+
+Purpose:
+    Encode the GraphQL response payload in a single pass. GRAPHQL_JSON_ENCODER is the dotted path
+    of a callable `encode(payload, pretty=False)` returning str or bytes.
+
+    orjson is used when installed, datetimes, dates, times and UUIDs are encoded natively by both
+    encoders. Everything else orjson doesn't know (Decimal, lazy translations, ...) falls back to
+    DjangoJSONEncoder.
+"""
+
+_django_encoder = DjangoJSONEncoder()
+
+
+def encode_json(payload, pretty=False):
+    if orjson is not None:
+        return encode_orjson(payload, pretty)
+    return encode_stdlib(payload, pretty)
+
+
+def encode_orjson(payload, pretty=False):
+    option = orjson.OPT_NON_STR_KEYS
+    if pretty:
+        option |= orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS
+    return orjson.dumps(payload, default=_django_encoder.default, option=option)
+
+
+def encode_stdlib(payload, pretty=False):
+    if pretty:
+        return json.dumps(payload, cls=DjangoJSONEncoder, sort_keys=True, indent=2, separators=(',', ': '))
+    return json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+
+_encoder = None
+
+
+def get_encoder():
+    global _encoder
+    if _encoder is None:
+        _encoder = import_string(settings.GRAPHQL_JSON_ENCODER)
+    return _encoder
@@ -1,4 +1,5 @@
 
+from django.conf import settings
 from graphql import GraphQLError
 
 
@@ -30,6 +31,13 @@ class PermissionDenied(GraphQLError):
     pass
 
 
+class FieldTimeoutError(GraphQLError):
+    """A field that didn't finish within GRAPHQL_TIMEOUT, reported instead of a TimeoutExit with GRAPHQL_TIMEOUT_PARTIAL."""
+
+    def __init__(self, nodes=None, path=None):
+        super().__init__(f"The field timed out (>{settings.GRAPHQL_TIMEOUT}ms).", nodes=nodes, path=path)
+
+
 class TimeoutExit(BaseException):
     """
     Exit the request because of a timeout.
@@ -0,0 +1,108 @@
+import contextvars
+import sys
+
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import QuerySet
+
+from promise import Promise
+
+from .db import request_queries
+from .exceptions import FieldTimeoutError, TimeoutExit
+from .meta import meta_base
+from .types import BaseType
+
+
+_root_field_pool = None
+
+
+def get_root_field_pool():
+    """Return the thread pool shared by all RootFieldThreadExecutors of this process."""
+    global _root_field_pool
+    if _root_field_pool is None:
+        _root_field_pool = ThreadPoolExecutor(
+            max_workers=settings.GRAPHQL_ROOT_FIELD_POOL_SIZE,
+            thread_name_prefix='graphql-root-field'
+        )
+    return _root_field_pool
+
+
+class RootFieldThreadExecutor:
+    """
+    graphql-core executor resolving independent root fields in parallel.
+
+    Root level model list fields (`qs_resolver`) of a query with more than one root field are
+    dispatched to a thread pool, each thread with its own DB connection. The queryset (including
+    its prefetches) is evaluated in the pool thread, so the request takes about as long as its
+    slowest root field. Everything else resolves synchronously, like with the default SyncExecutor.
+
+    Promises are only settled back on the request thread in `wait_until_finished`, the promise
+    library isn't thread safe. The context (MetaBase request scope) is copied into the pool thread.
+    With GRAPHQL_TIMEOUT_PARTIAL, root fields not finished in time are rejected with a FieldTimeoutError
+    instead of aborting the request.
+    """
+
+    def __init__(self):
+        self.pending = []  # [(future, promise, info)]
+
+    def execute(self, fn, *args, **kwargs):
+        source, info = args  # graphql-core calls executor.execute(resolve_fn, source, info, **args)
+
+        if not self._is_parallel(info):
+            return fn(*args, **kwargs)
+
+        context = contextvars.copy_context()
+        future = get_root_field_pool().submit(context.run, self._resolve, fn, args, kwargs)
+        promise = Promise()
+        self.pending.append((future, promise, info))
+        return promise
+
+    def _is_parallel(self, info):
+        if len(info.path) != 1 or info.operation.operation != 'query':
+            return False
+        if len(info.operation.selection_set.selections) < 2:
+            return False
+        NodeType = getattr(getattr(info.return_type, 'of_type', None), 'graphene_type', None)
+        return isinstance(NodeType, type) and issubclass(NodeType, BaseType)
+
+    @staticmethod
+    def _resolve(fn, args, kwargs):
+        close_old_connections()
+        try:
+            with request_queries():  # the pool thread connection needs the request deadline as well
+                result = fn(*args, **kwargs)
+                if isinstance(result, Promise) and result.is_fulfilled:
+                    result = result.get()  # graphene middleware wraps resolver results in a resolved promise
+                if isinstance(result, QuerySet):
+                    result = list(result)  # run the SQL here, not during completion on the request thread
+                return result
+        finally:
+            close_old_connections()
+
+    def wait_until_finished(self):
+        while self.pending:
+            pending, self.pending = self.pending, []
+
+            for i, (future, promise, info) in enumerate(pending):
+                try:
+                    value = future.result(timeout=max(meta_base.remaining_time(), 0) / 1000)
+                except (FutureTimeoutError, TimeoutExit):
+                    if not settings.GRAPHQL_TIMEOUT_PARTIAL:
+                        self._cancel(pending[i:])
+                        raise TimeoutExit()
+                    future.cancel()
+                    promise.do_reject(FieldTimeoutError(nodes=info.field_asts, path=info.path))
+                except Exception as e:
+                    promise.do_reject(e, traceback=sys.exc_info()[2])
+                else:
+                    promise.do_resolve(value)
+
+    def _cancel(self, pending):
+        for future, promise, info in pending + self.pending:
+            future.cancel()
+        self.pending = []
+
+    def clean(self):
+        self.pending = []
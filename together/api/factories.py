@@ -112,6 +112,7 @@ def qs_resolver_factory(NodeType, single=False, source_fieldname=None):
         else:
             return construct_qs(NodeType, selection, root=True)
 
+    qs_resolver.node_type = NodeType  # lets api.cache tell generated resolvers from custom ones
     return qs_resolver
 
 
@@ -121,4 +122,5 @@ def getattr_resolver_factory(attr):
     def getattr_resolver(obj, info):
         return getattr(obj, attr, None)
 
+    getattr_resolver.attribute = attr  # lets api.streaming read the column directly
     return getattr_resolver
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import time
+
+from functools import wraps
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from graphql import GraphQLError
+
+from .meta import meta_base
+
+
+"""
+Idempotency keys
+
+Purpose:
+    Let clients retry mutations on flaky networks without executing them twice. A mutation with
+    `idempotent = True` (api.mutations.Save, BulkSave) accepts a key as the `Idempotency-Key` header or
+    its `idempotencyKey` argument, the argument wins.
+
+    The payload of the first successful execution is stored for GRAPHQL_IDEMPOTENCY_TTL seconds under
+    (user, response path of the mutation field, key), a retry with the same key gets the stored payload
+    without executing the mutation again. The path holds the alias, so aliased mutations in one document
+    sharing the header key are executed and stored separately, their retries have to keep the aliases. Reusing a key with different arguments is an error. Failed executions aren't stored,
+    their retries execute again.
+
+    Concurrent duplicates are serialized by a lock taken with cache.add (atomic in memcached and redis).
+    The duplicate waits for the stored payload as long as its GRAPHQL_TIMEOUT allows, the lock expires
+    after GRAPHQL_IDEMPOTENCY_LOCK_TIMEOUT seconds if its holder dies.
+
+    CACHES[GRAPHQL_IDEMPOTENCY_CACHE_ALIAS] has to be shared by all processes: a retry served by another
+    worker doesn't see the payload or the lock of a local memory cache and executes again. The system
+    check api.W001 warns about a per-process cache, the dummy cache (api.E001) can't store anything.
+
+    Keys of anonymous requests are ignored, there is no user to scope them to. The payload is a snapshot,
+    model instances in it are resolved with their state at the first execution.
+"""
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+
+
+def _cache():
+    return caches[settings.GRAPHQL_IDEMPOTENCY_CACHE_ALIAS]
+
+
+LOCAL_CACHE_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+DUMMY_CACHE_BACKENDS = ('django.core.cache.backends.dummy.DummyCache',)
+
+
+def check_idempotency_cache(app_configs, **kwargs):
+    """System check of CACHES[GRAPHQL_IDEMPOTENCY_CACHE_ALIAS], it has to be shared by all processes."""
+    alias = settings.GRAPHQL_IDEMPOTENCY_CACHE_ALIAS
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+
+    if backend is None:
+        return [checks.Error(f"GRAPHQL_IDEMPOTENCY_CACHE_ALIAS '{alias}' is not in CACHES.", id='api.E001')]
+    if backend in DUMMY_CACHE_BACKENDS:
+        return [checks.Error(f"Idempotency cache '{alias}' is a dummy cache, it can't store payloads or locks.", id='api.E001')]
+    if backend in LOCAL_CACHE_BACKENDS:
+        return [checks.Warning(
+            f"Idempotency cache '{alias}' is local to each process, retries served by another process execute again.",
+            hint="Point GRAPHQL_IDEMPOTENCY_CACHE_ALIAS to a shared cache (redis, memcached or the database cache).",
+            id='api.W001',
+        )]
+    return []
+
+
+def _fingerprint(kwargs):
+    return hashlib.sha256(json.dumps(kwargs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def get_idempotency_key(info, idempotency_key=None):
+    key = idempotency_key or info.context.META.get(IDEMPOTENCY_HEADER)
+    if key and len(key) > settings.GRAPHQL_IDEMPOTENCY_KEY_LENGTH:
+        raise GraphQLError(f"Idempotency key is limited to {settings.GRAPHQL_IDEMPOTENCY_KEY_LENGTH} characters.")
+    return key
+
+
+class IdempotentExecution:
+    """Stored payload and lock of a single (user, mutation path, key)."""
+
+    def __init__(self, user, path, key, kwargs):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        self.key = f'graphql:idempotency:{user.pk}:{".".join(map(str, path))}:{digest}'
+        self.lock_key = f'{self.key}:lock'
+        self.fingerprint = _fingerprint(kwargs)
+
+    def stored(self):
+        """The payload values of the first execution, None when there is none."""
+        stored = _cache().get(self.key)
+        if stored is None:
+            return None
+        fingerprint, values = stored
+        if fingerprint != self.fingerprint:
+            raise GraphQLError("Idempotency key was already used with different arguments.")
+        return values
+
+    def store(self, values):
+        _cache().set(self.key, (self.fingerprint, values), settings.GRAPHQL_IDEMPOTENCY_TTL)
+
+    def lock(self):
+        return _cache().add(self.lock_key, 1, settings.GRAPHQL_IDEMPOTENCY_LOCK_TIMEOUT)
+
+    def unlock(self):
+        _cache().delete(self.lock_key)
+
+    def acquire(self):
+        """
+        Wait until the payload is stored or the lock is taken, return the stored values or None
+        when the caller holds the lock and executes the mutation.
+        """
+        while True:
+            values = self.stored()
+            if values is not None:
+                return values
+            if self.lock():
+                values = self.stored()  # stored between the check and the lock
+                if values is not None:
+                    self.unlock()
+                return values
+            if meta_base.remaining_time() <= 0:
+                raise GraphQLError("A request with the same idempotency key is in progress, retry later.")
+            time.sleep(settings.GRAPHQL_IDEMPOTENCY_POLL_INTERVAL)
+
+
+def idempotent_mutate(mutate):
+    """Wrap the mutate function of a mutation (cls, root, info, **kwargs) in an idempotent execution."""
+
+    @wraps(mutate)
+    def wrapper(cls, root, info, idempotency_key=None, **kwargs):
+        key = get_idempotency_key(info, idempotency_key)
+        user = getattr(info.context, 'user', None)
+
+        if not key or not getattr(user, 'is_authenticated', False):
+            return mutate(cls, root, info, **kwargs)
+
+        execution = IdempotentExecution(user, info.path, key, kwargs)
+        values = execution.acquire()
+        if values is not None:
+            return cls(**values)
+
+        try:
+            payload = mutate(cls, root, info, **kwargs)
+            if payload is not None:
+                execution.store({name: getattr(payload, name, None) for name in cls._meta.fields})
+            return payload
+        finally:
+            execution.unlock()
+
+    return wrapper
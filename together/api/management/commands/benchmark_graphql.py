@@ -0,0 +1,83 @@
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Local load benchmark of the GraphQL endpoint.
+
+    Fires the same query at one or more running servers with high concurrency and prints
+    throughput and latency percentiles side by side. Compare WSGI and ASGI by running both:
+
+        gunicorn config.wsgi:application -b :8000 --threads 16
+        uvicorn config.asgi:application --port 8001
+        ./manage.py benchmark_graphql --url http://localhost:8000/graphql --url http://localhost:8001/graphql
+    """
+
+    help = "Compare GraphQL throughput of running servers (i.e. WSGI vs ASGI) at high concurrency."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', action='append', required=True, help="GraphQL endpoint, can be repeated.")
+        parser.add_argument('--query', default='{ users { id username } }')
+        parser.add_argument('--token', default=None, help="JWT sent as `Authorization: JWT <token>`.")
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--timeout', type=float, default=30, help="Client side timeout in seconds.")
+
+    def handle(self, *args, **options):
+        headers = {'Content-Type': 'application/json'}
+        if options['token']:
+            headers['Authorization'] = f"JWT {options['token']}"
+        body = json.dumps({'query': options['query']}).encode('utf-8')
+
+        for url in options['url']:
+            self._warm_up(url, body, headers, options['timeout'])
+            stats = self._run(url, body, headers, options['concurrency'], options['requests'], options['timeout'])
+            self.stdout.write(self._format(url, stats))
+
+    def _request(self, url, body, headers, timeout):
+        start = time.perf_counter()
+        try:
+            request = urllib.request.Request(url, data=body, headers=headers)
+            response = urllib.request.urlopen(request, timeout=timeout)
+            payload = json.loads(response.read())
+            ok = payload.get('success') != 'TIMEOUT' and not payload.get('errors')
+        except (urllib.error.URLError, OSError, ValueError):
+            ok = False
+        return ok, (time.perf_counter() - start) * 1000
+
+    def _warm_up(self, url, body, headers, timeout):
+        for _ in range(10):
+            self._request(url, body, headers, timeout)
+
+    def _run(self, url, body, headers, concurrency, count, timeout):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda _: self._request(url, body, headers, timeout), range(count)))
+        duration = time.perf_counter() - start
+
+        latencies = sorted(latency for ok, latency in results)
+        quantiles = statistics.quantiles(latencies, n=100)
+
+        return {
+            'throughput': count / duration,
+            'errors': sum(1 for ok, latency in results if not ok),
+            'count': count,
+            'p50': quantiles[49],
+            'p95': quantiles[94],
+            'p99': quantiles[98],
+        }
+
+    def _format(self, url, stats):
+        return (
+            f"{url}\n"
+            f"  {stats['throughput']:.1f} req/s, {stats['errors']}/{stats['count']} failed\n"
+            f"  latency p50 {stats['p50']:.1f}ms, p95 {stats['p95']:.1f}ms, p99 {stats['p99']:.1f}ms"
+        )
@@ -0,0 +1,86 @@
+import glob
+import json
+import time
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Top-N report of the slow operation log (api.slowlog).
+
+    Groups the records of the GRAPHQL_SLOW_LOG_PATH.<pid> files of all processes and their rotated
+    files by fingerprint:
+
+        ./manage.py slow_operations --top 10 --order p95 --since 24
+    """
+
+    help = "Aggregate the GraphQL slow log by query fingerprint."
+
+    ORDERS = ('total', 'p95', 'count', 'sql')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--order', choices=self.ORDERS, default='total', help="Sort by summed time, p95, count or summed SQL time.")
+        parser.add_argument('--since', type=float, default=None, help="Only records of the last N hours.")
+        parser.add_argument('--documents', action='store_true', help="Print the normalized documents.")
+
+    def handle(self, *args, **options):
+        since = time.time() - options['since'] * 3600 if options['since'] else 0
+        operations = defaultdict(lambda: {'durations': [], 'sql': 0.0, 'sql_count': 0, 'names': set(), 'document': None})
+
+        for record in self._records():
+            if record['time'] < since:
+                continue
+            operation = operations[record['fingerprint']]
+            operation['durations'].append(record['duration']['total'])
+            operation['sql'] += record['duration']['sql']
+            operation['sql_count'] += record['sqlCount']
+            operation['names'].add(record['operation'] or 'anonymous')
+            operation['document'] = record['document']
+
+        stats = [self._stats(fingerprint, operation) for fingerprint, operation in operations.items()]
+        stats.sort(key=lambda s: s[options['order']], reverse=True)
+
+        if not stats:
+            self.stdout.write("No slow operations recorded.")
+
+        for s in stats[:options['top']]:
+            self.stdout.write(self._format(s, options['documents']))
+
+    def _records(self):
+        for path in sorted(glob.glob(f'{settings.GRAPHQL_SLOW_LOG_PATH}*')):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue  # line cut off by a rotation or crash
+
+    def _stats(self, fingerprint, operation):
+        durations = sorted(operation['durations'])
+        count = len(durations)
+        return {
+            'fingerprint': fingerprint,
+            'names': ', '.join(sorted(operation['names'])),
+            'document': operation['document'],
+            'count': count,
+            'total': sum(durations),
+            'p95': durations[min(int(count * .95), count - 1)],
+            'max': durations[-1],
+            'sql': operation['sql'],
+            'sql_count': operation['sql_count'] / count,
+        }
+
+    def _format(self, s, documents):
+        text = (
+            f"{s['fingerprint']}  {s['names']}\n"
+            f"  {s['count']} slow, total {s['total']:.0f}ms, p95 {s['p95']:.0f}ms, max {s['max']:.0f}ms\n"
+            f"  sql {s['sql']:.0f}ms, {s['sql_count']:.1f} statements per request"
+        )
+        if documents:
+            text += '\n' + '\n'.join(f'    {line}' for line in s['document'].splitlines())
+        return text
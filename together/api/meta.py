@@ -1,5 +1,7 @@
 import time
-from threading import local
+
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 from django.conf import settings
 
@@ -29,21 +31,72 @@ def popmeta(function):
     return _popmeta
 
 
-class MetaBase(local, metaclass=Singleton):
+class RequestState:
+    """
+    State of a single request.
+
+    Shared by reference between every thread and task working on the request,
+    contexts copied with `contextvars.copy_context` see the same object.
+    """
+
+    def __init__(self):
+        self.query_meta_dict = {'default': QueryMeta()}
+        self.start_time = time.time()
+        self.cache_key_prefix = None
+        self.warnings = []
+        self.query_observers = []
+        self.statement_listeners = []
+        self.billables = {}
+        self.timed_out_paths = []
+
+
+_request_state = ContextVar('api_request_state', default=None)
+_active_query = ContextVar('api_active_query', default=None)  # per context, parallel operations don't share it
+
+
+@contextmanager
+def request_scope():
+    """Open a fresh RequestState for the duration of a request."""
+    state_token = _request_state.set(RequestState())
+    active_query_token = _active_query.set(None)
+    try:
+        yield
+    finally:
+        _active_query.reset(active_query_token)
+        _request_state.reset(state_token)
+
+
+class MetaBase(metaclass=Singleton):
     """
     Meta base class.
 
     MetaBase holds a single QueryMeta per graphene operation in a single request.
+    The instance itself is stateless, the request state lives in contextvars, which
+    makes it safe to use from threaded and async workers.
     """
 
-    _query_meta_dict = {}
-    _active_query = None
-    cache_key_prefix = None
-    warnings = []
+    @property
+    def _state(self):
+        state = _request_state.get()
+        if state is None:  # outside of a request_scope, i.e. shell or management commands
+            return RequestState()  # throwaway, a state set here would leak into whatever runs next in the thread
+        return state
 
-    def __init__(self):
-        self._query_meta_dict['default'] = QueryMeta()
-        self._start_time = time.time()
+    @property
+    def _query_meta_dict(self):
+        return self._state.query_meta_dict
+
+    @property
+    def cache_key_prefix(self):
+        return self._state.cache_key_prefix
+
+    @cache_key_prefix.setter
+    def cache_key_prefix(self, value):
+        self._state.cache_key_prefix = value
+
+    @property
+    def warnings(self):
+        return self._state.warnings
 
     def to_dict(self):
         return [{
@@ -56,7 +109,7 @@ class MetaBase(local, metaclass=Singleton):
 
     def get_meta(self):
         try:
-            return self._query_meta_dict.get(self._active_query, self._query_meta_dict['default'])
+            return self._query_meta_dict.get(_active_query.get(), self._query_meta_dict['default'])
         except KeyError:
             self._query_meta_dict['default'] = QueryMeta()
             return self._query_meta_dict['default']
@@ -64,13 +117,17 @@ class MetaBase(local, metaclass=Singleton):
     def activate_query(self, query_name):
         if query_name not in self._query_meta_dict:
             raise KeyError(f"Meta activation error, cannot find meta for operation: {query_name}.")
-        self._active_query = query_name
+        _active_query.set(query_name)
 
     def active_query(self):
-        return self._active_query
+        return _active_query.get()
 
     def execution_time(self):
-        return (time.time() - self._start_time) * 1000
+        return (time.time() - self._state.start_time) * 1000
+
+    def remaining_time(self):
+        """Milliseconds left until the request hits GRAPHQL_TIMEOUT."""
+        return settings.GRAPHQL_TIMEOUT - self.execution_time()
 
     def abort_request_if_timedout(self):
         """
@@ -84,16 +141,26 @@ class MetaBase(local, metaclass=Singleton):
         if self.execution_time() > settings.GRAPHQL_TIMEOUT:
             raise TimeoutExit()
 
+    def add_timed_out_path(self, path):
+        """Field nulled by a graceful timeout (GRAPHQL_TIMEOUT_PARTIAL)."""
+        self._state.timed_out_paths.append(path)
+
+    def get_timed_out_paths(self):
+        return self._state.timed_out_paths
+
     def reset_execution_time(self):
-        self._start_time = time.time()
+        self._state.start_time = time.time()
 
     def reset(self):
-        self._query_meta_dict = {}
-        self._active_query = None
-        self._query_meta_dict['default'] = QueryMeta()
-        self.reset_execution_time()
-        self.cache_key_prefix = None
-        self.warnings = []
+        _request_state.set(RequestState())
+        _active_query.set(None)
+
+    def reset_operation(self):
+        """Start the next operation of a batch, keeps the request timer, observers and billables."""
+        self._state.query_meta_dict = {'default': QueryMeta()}
+        self._state.warnings = []
+        self._state.timed_out_paths = []
+        _active_query.set(None)
 
     def add_warning(self, warning):
         self.warnings.append(warning)
@@ -101,6 +168,32 @@ class MetaBase(local, metaclass=Singleton):
     def get_warnings(self):
         return self.warnings
 
+    def add_billable(self, key, wall_time, sql_time=0, sql_count=0, rows=0):
+        """Accumulate resources used by a billable call, see api.metering."""
+        usage = self._state.billables.setdefault(key, {'calls': 0, 'wall_time': 0, 'sql_time': 0, 'sql_count': 0, 'rows': 0})
+        usage['calls'] += 1
+        usage['wall_time'] += wall_time
+        usage['sql_time'] += sql_time
+        usage['sql_count'] += sql_count
+        usage['rows'] += rows
+
+    def get_billables(self):
+        return self._state.billables
+
+    def add_query_observer(self, observer):
+        """Call `observer(sql, duration_ms)` for every statement the request executes, see api.db."""
+        self._state.query_observers.append(observer)
+
+    def get_query_observers(self):
+        return self._state.query_observers
+
+    def add_statement_listener(self, listener):
+        """Call `listener(sql)` before every statement the request executes, see api.db."""
+        self._state.statement_listeners.append(listener)
+
+    def get_statement_listeners(self):
+        return self._state.statement_listeners
+
 
 class QueryMeta:
     user = None
@@ -148,4 +241,4 @@ meta = MetaShortcut()
 meta_base = MetaBase()
 
 # apply patches needed for MetaBase.abort_request_if_timedout to work
-from .patches import call, execute_fields
+from .patches import call, complete_value, execute_fields, resolve_field
@@ -0,0 +1,165 @@
+import atexit
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import QuerySet
+
+from .meta import meta_base
+from .models import Usage
+from .utils import get_request_user
+
+
+"""
+Metering
+
+Purpose:
+    1) measure wall time, SQL time, SQL count and returned rows of every call to a function
+       decorated with api.decorators.billable, accumulated per key on the request (MetaBase.add_billable)
+    2) aggregate the request totals per key and user in a process wide buffer and write it to
+       api.Usage in batches, every GRAPHQL_USAGE_FLUSH_RECORDS rows or GRAPHQL_USAGE_FLUSH_INTERVAL seconds
+
+SQL is only attributed within requests served by GraphQLView, where the query observers are installed.
+"""
+
+_active_meters = ContextVar('api_active_meters', default=())
+
+
+class Meter:
+    """Resources used by a single billable call."""
+
+    def __init__(self, key):
+        self.key = key
+        self.start = time.perf_counter()
+        self.sql_time = 0.0
+        self.sql_count = 0
+        self.rows = 0
+
+    def wall_time(self):
+        return (time.perf_counter() - self.start) * 1000
+
+
+def _record_sql(sql, duration):
+    """Query observer, nested billable calls all get charged for the statement."""
+    for meter in _active_meters.get():
+        meter.sql_time += duration
+        meter.sql_count += 1
+
+
+def count_rows(value):
+    """Number of rows returned by a billable function, evaluates querysets so their SQL is metered."""
+    if isinstance(value, QuerySet):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return len(value)
+    return int(value is not None)
+
+
+@contextmanager
+def metered(key):
+    """Measure the block and add it to the request usage of `key`."""
+    if _record_sql not in meta_base.get_query_observers():
+        meta_base.add_query_observer(_record_sql)
+
+    meter = Meter(key)
+    token = _active_meters.set(_active_meters.get() + (meter,))
+    try:
+        yield meter
+    finally:
+        _active_meters.reset(token)
+        meta_base.add_billable(key, meter.wall_time(), meter.sql_time, meter.sql_count, meter.rows)
+
+
+class UsageBuffer:
+    """
+    Process wide buffer of Usage rows aggregated per (key, user).
+
+    A flush hands the rows over to a background thread for the bulk_create, so the request crossing
+    the threshold doesn't wait for the write. A daemon thread flushes the rows of an idle process once
+    GRAPHQL_USAGE_FLUSH_INTERVAL passed, the rest is written at exit.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = {}  # {(key, user_id): Usage}
+        self._last_flush = time.monotonic()
+        self._flusher = None  # pid of the process running the flusher thread, a forked process starts its own
+
+    def add(self, user_id, billables):
+        self._start_flusher()
+
+        with self._lock:
+            for key, usage in billables.items():
+                record = self._records.get((key, user_id))
+                if record is None:
+                    record = self._records[(key, user_id)] = Usage(key=key, user_id=user_id)
+                record.calls += usage['calls']
+                record.wall_time += usage['wall_time']
+                record.sql_time += usage['sql_time']
+                record.sql_count += usage['sql_count']
+                record.rows += usage['rows']
+
+            records = self._take() if self._flush_due() else None
+
+        if records:
+            threading.Thread(target=self._write, args=(records,), name='usage-flush').start()
+
+    def flush(self):
+        with self._lock:
+            records = self._take()
+        self._write(records)
+
+    def _start_flusher(self):
+        pid = os.getpid()
+        if self._flusher == pid:
+            return
+        with self._lock:
+            if self._flusher != pid:
+                self._flusher = pid
+                threading.Thread(target=self._flush_periodically, name='usage-flusher', daemon=True).start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(settings.GRAPHQL_USAGE_FLUSH_INTERVAL)
+            with self._lock:
+                records = self._take() if self._records and self._flush_due() else None
+            if records:
+                self._write(records)
+
+    def _flush_due(self):
+        if len(self._records) >= settings.GRAPHQL_USAGE_FLUSH_RECORDS:
+            return True
+        return time.monotonic() - self._last_flush >= settings.GRAPHQL_USAGE_FLUSH_INTERVAL
+
+    def _take(self):
+        records, self._records = list(self._records.values()), {}
+        self._last_flush = time.monotonic()
+        return records
+
+    @staticmethod
+    def _write(records):
+        if not records:
+            return
+        try:
+            Usage.objects.bulk_create(records, batch_size=500)
+        finally:
+            connection.close()  # the connection belongs to the flushing thread
+
+
+usage_buffer = UsageBuffer()
+atexit.register(usage_buffer.flush)
+
+
+def record_usage(request):
+    """Move the billables of the current request into the usage buffer."""
+    billables = meta_base.get_billables()
+    if not billables:
+        return
+    user = get_request_user(request)
+    user_id = user.id if getattr(user, 'is_authenticated', False) else None
+    usage_buffer.add(user_id, billables)
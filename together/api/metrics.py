@@ -0,0 +1,304 @@
+import atexit
+import glob
+import hmac
+import json
+import os
+import threading
+import time
+
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from .meta import meta_base
+from .utils import get_request_user
+
+
+"""
+Metrics
+
+Purpose:
+    In-process metrics registry exposed in the Prometheus text format by api.views.metrics_view.
+
+    An observation is a dict update under a per-metric lock. With GRAPHQL_METRICS_DIR set, every
+    process dumps its samples into `<dir>/metrics_<pid>_<start>.json` at most every GRAPHQL_METRICS_DUMP_INTERVAL
+    seconds (and on exit), the metrics view sums the samples of all processes. Gauges only count
+    processes that are still alive, counters and histograms of finished processes are kept. The start
+    time of the process keeps a reused pid from taking over the file and the gauges of a dead process.
+
+    The view is off unless GRAPHQL_METRICS is set and only served to staff users and to requests
+    with the GRAPHQL_METRICS_TOKEN bearer token.
+"""
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # {label values tuple: value}
+        registry.register(self)
+
+    def samples(self):
+        with self._lock:
+            return {labels: self._copy(value) for labels, value in self._values.items()}
+
+    def _copy(self, value):
+        return value
+
+    def merge(self, a, b):
+        return a + b
+
+    def lines(self, samples):
+        for labels, value in sorted(samples.items()):
+            yield f'{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}'
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    """Stores a count per bucket (the last one being +Inf) followed by the sum of observations."""
+    type = 'histogram'
+
+    def __init__(self, name, description, labelnames=(), buckets=()):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, description, labelnames)
+
+    def observe(self, value, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            sample = self._values.get(labels)
+            if sample is None:
+                sample = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            sample[i] += 1
+            sample[-1] += value
+
+    def _copy(self, value):
+        return list(value)
+
+    def merge(self, a, b):
+        return [x + y for x, y in zip(a, b)]
+
+    def lines(self, samples):
+        for labels, sample in sorted(samples.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), sample[:-1]):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else format_value(bound)
+                yield f'{self.name}_bucket{format_labels(self.labelnames + ("le",), labels + (le,))} {cumulative}'
+            yield f'{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(sample[-1])}'
+            yield f'{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}'
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.metrics = {}
+        self._last_dump = 0
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    def _snapshot(self):
+        return {name: metric.samples() for name, metric in self.metrics.items()}
+
+    def _path(self, pid, start):
+        return os.path.join(settings.GRAPHQL_METRICS_DIR, f'metrics_{pid}_{start}.json')
+
+    def dump(self):
+        """Write the samples of this process into the multiprocess directory."""
+        if not settings.GRAPHQL_METRICS_DIR:
+            return
+        data = {name: [[list(labels), value] for labels, value in samples.items()] for name, samples in self._snapshot().items()}
+        path = self._path(os.getpid(), _own_start())
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(data, f)
+        os.replace(f'{path}.tmp', path)  # readers never see a half written file
+        self._last_dump = time.monotonic()
+
+    def maybe_dump(self):
+        if settings.GRAPHQL_METRICS_DIR and time.monotonic() - self._last_dump >= settings.GRAPHQL_METRICS_DUMP_INTERVAL:
+            self.dump()
+
+    def collect(self):
+        """Samples of all processes, or only this one when not running in multiprocess mode."""
+        if not settings.GRAPHQL_METRICS_DIR:
+            return self._snapshot()
+
+        self.dump()
+        collected = {name: {} for name in self.metrics}
+
+        for path in glob.glob(os.path.join(settings.GRAPHQL_METRICS_DIR, 'metrics_*.json')):
+            try:
+                pid, start = map(int, os.path.basename(path)[len('metrics_'):-len('.json')].split('_'))
+            except ValueError:
+                continue  # not a dump of this version
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue  # removed or replaced meanwhile
+
+            for name, samples in data.items():
+                metric = self.metrics.get(name)
+                if metric is None or (metric.type == 'gauge' and not _is_alive(pid, start)):
+                    continue
+                merged = collected[name]
+                for labels, value in samples:
+                    labels = tuple(labels)
+                    merged[labels] = metric.merge(merged[labels], value) if labels in merged else value
+
+        return collected
+
+    def exposition(self):
+        lines = []
+        for name, samples in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f'# HELP {name} {metric.description}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            lines.extend(metric.lines(samples))
+        return '\n'.join(lines) + '\n'
+
+
+def _process_start(pid):
+    """Start time of a process in clock ticks after boot, None without procfs."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return int(f.read().rsplit(')', 1)[1].split()[19])  # field 22, the command name may hold spaces
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+_started = {}  # {pid: start}, a forked process gets its own entry
+
+
+def _own_start():
+    pid = os.getpid()
+    if pid not in _started:
+        _started[pid] = _process_start(pid) or int(time.time() * 1000)
+    return _started[pid]
+
+
+def _is_alive(pid, start):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    running_start = _process_start(pid)
+    return running_start is None or running_start == start  # otherwise the pid was reused
+
+
+def metrics_allowed(request):
+    token = settings.GRAPHQL_METRICS_TOKEN
+    if token and hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return True
+    return getattr(get_request_user(request), 'is_staff', False)
+
+
+registry = MetricsRegistry()
+atexit.register(registry.dump)
+
+
+# GraphQL metrics
+
+request_duration = Histogram(
+    'graphql_request_duration_seconds',
+    'GraphQL request latency.',
+    ('operation', 'success'),
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+resolvers_total = Counter('graphql_resolvers_total', 'Resolved fields.', ('operation',))
+request_sql_queries = Histogram(
+    'graphql_request_sql_queries',
+    'SQL statements executed per request.',
+    ('operation',),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+cache_requests_total = Counter('graphql_cache_requests_total', 'Response cache lookups.', ('result',))
+timeouts_total = Counter('graphql_timeouts_total', 'Requests aborted by GRAPHQL_TIMEOUT.', ('operation',))
+
+
+_request_metrics = ContextVar('api_request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Resolver and SQL counts of the current request."""
+
+    def __init__(self):
+        self.resolvers = 0
+        self.sql_queries = 0
+
+    def record_sql(self, sql, duration):
+        self.sql_queries += 1
+
+
+def start_request_metrics():
+    request_metrics = RequestMetrics()
+    _request_metrics.set(request_metrics)
+    meta_base.add_query_observer(request_metrics.record_sql)
+    return request_metrics
+
+
+def get_request_metrics():
+    return _request_metrics.get()
+
+
+_operation_names = set()
+
+
+def operation_label(operation_name):
+    """Client controlled operation names are capped to GRAPHQL_METRICS_MAX_OPERATIONS label values."""
+    operation_name = (operation_name or 'anonymous')[:64]
+    if operation_name not in _operation_names:
+        if len(_operation_names) >= settings.GRAPHQL_METRICS_MAX_OPERATIONS:
+            return 'other'
+        _operation_names.add(operation_name)
+    return operation_name
+
+
+def observe_request(operation_name, success, request_metrics):
+    operation = operation_label(operation_name)
+    request_duration.observe(meta_base.execution_time() / 1000, operation, success)
+    resolvers_total.inc(operation, amount=request_metrics.resolvers)
+    request_sql_queries.observe(request_metrics.sql_queries, operation)
+    if success == 'TIMEOUT':
+        timeouts_total.inc(operation)
+    registry.maybe_dump()
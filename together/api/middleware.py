@@ -1,6 +1,13 @@
+import asyncio
+import time
 
-from .meta import QueryMeta, reset_meta, meta_base
+from django.db.models import QuerySet
+from promise import Promise
+
+from .meta import QueryMeta, meta_base, request_scope
+from .metrics import get_request_metrics
 from .parsing import get_operation_name
+from .profiling import _resolver_path, field_path, get_profiler
 from .utils import is_root_info
 
 
@@ -41,13 +48,61 @@ class TimeoutMiddleware:
         return next(root, info, *args, **kwargs)
 
 
+class MetricsMiddleware:
+    """Counts resolved fields of the request for api.metrics."""
+
+    def resolve(self, next, root, info, *args, **kwargs):
+        request_metrics = get_request_metrics()
+        if request_metrics is not None:
+            request_metrics.resolvers += 1
+        return next(root, info, *args, **kwargs)
+
+
+class ProfilingMiddleware:
+    """
+    Profiling middleware
+
+    Times each resolver and marks its path as active for SQL attribution when the request is profiled.
+    Querysets are evaluated inside the resolver to count their rows and attribute their SQL to it.
+    """
+
+    def resolve(self, next, root, info, *args, **kwargs):
+        profiler = get_profiler()
+
+        if profiler is None:
+            return next(root, info, *args, **kwargs)
+
+        path = field_path(info)
+        token = _resolver_path.set(path)
+        start = time.perf_counter()
+
+        try:
+            result = next(root, info, *args, **kwargs)
+            value = result.get() if isinstance(result, Promise) and result.is_fulfilled else result
+            if isinstance(value, QuerySet):
+                profiler.record_rows(path, value.model, len(value))
+            return result
+        finally:
+            profiler.record_resolver(path, (time.perf_counter() - start) * 1000)
+            _resolver_path.reset(token)
+
+
 class MetaCleanupMiddleware:
-    """Resets BaseMeta when request is fullfiled."""
+    """Opens a fresh MetaBase request scope for every request and drops it when the request is fullfiled."""
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine  # marks this middleware as async for Django
 
     def __call__(self, request):
-        reset_meta()
-        response = self.get_response(request)
-        reset_meta()
-        return response
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        with request_scope():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with request_scope():
+            return await self.get_response(request)
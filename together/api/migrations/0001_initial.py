@@ -0,0 +1,35 @@
+# Generated by Django 3.2.9 on 2026-10-19 10:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Usage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(db_index=True, help_text='Key of the api.decorators.billable decorator.', max_length=128)),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('calls', models.PositiveIntegerField(default=0)),
+                ('wall_time', models.FloatField(default=0, help_text='Milliseconds.')),
+                ('sql_time', models.FloatField(default=0, help_text='Milliseconds.')),
+                ('sql_count', models.PositiveIntegerField(default=0)),
+                ('rows', models.PositiveIntegerField(default=0, help_text='Rows returned by the billable function.')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='usages', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('-created',),
+            },
+        ),
+    ]
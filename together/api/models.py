@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class Usage(models.Model):
+    """Resources consumed by a user through a billable key, aggregated over one flush window."""
+
+    key = models.CharField(max_length=128, db_index=True, help_text='Key of the api.decorators.billable decorator.')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='usages')
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+
+    calls = models.PositiveIntegerField(default=0)
+    wall_time = models.FloatField(default=0, help_text='Milliseconds.')
+    sql_time = models.FloatField(default=0, help_text='Milliseconds.')
+    sql_count = models.PositiveIntegerField(default=0)
+    rows = models.PositiveIntegerField(default=0, help_text='Rows returned by the billable function.')
+
+    class Meta:
+        ordering = '-created',
+
+    def __str__(self):
+        return f'{self.key} ({self.user_id}): {self.calls} calls'
@@ -2,17 +2,25 @@ import graphene
 
 from collections import OrderedDict
 
+from django.conf import settings
+from django.db.models.deletion import ProtectedError, RestrictedError
+from graphql import GraphQLError
+
 from .converter import convert_django_field_to_input
 from .exceptions import PermissionDenied
-from .fields import ModelField
+from .fields import ModelField, ModelListField
+from .filters import DjangoFilter
+from .idempotency import idempotent_mutate
 
 from utils.core import inherit_from, copy_class
+from utils.deletion import delete_in_chunks, estimate_deletion
 from utils.string import camel_to_snake, decapitalize
 from graphql_jwt.decorators import login_required
 
 
 class Mutation:
     description = None
+    idempotent = False  # accept an idempotency key and store the payload for retries, see api.idempotency
 
     class Arguments:
         pass
@@ -25,6 +33,9 @@ class Mutation:
         arguments = cls.get_arguments()  # construct arguments if not specified manually on cls.Meta
         Out = copy_class(cls)
         Out.__name__ += 'Payload'
+        if cls.idempotent and hasattr(cls, 'mutate'):
+            arguments['idempotency_key'] = graphene.String(description='Retries with the same key get the first payload, the header Idempotency-Key works as well.')
+            Out.mutate = classmethod(idempotent_mutate(cls.mutate.__func__))
         Out = inherit_from(Out, graphene.Mutation, persist_meta=True)
         return Out.Field()
 
@@ -127,6 +138,7 @@ class ModelMutation(Mutation):
 
 class Save(ModelMutation):
     description = 'Equivalent to UPDATE if id passed, else CREATE.'
+    idempotent = True
 
     @classmethod
     def field(cls):
@@ -147,6 +159,50 @@ class Save(ModelMutation):
         return cls(**{model_name: instance})
 
 
+class BulkSaveError(graphene.ObjectType):
+    index = graphene.Int(description='Position of the item in `items`.')
+    field = graphene.String(description='Invalid field, null for errors of the whole item.')
+    messages = graphene.List(graphene.String)
+
+
+class BulkSave(ModelMutation):
+    description = 'Equivalent to Save for many items at once, all of them are saved or none if any is invalid.'
+    idempotent = True
+
+    @classmethod
+    def get_list_name(cls):
+        return f'{decapitalize(cls.Meta.model.__name__)}_list'
+
+    @classmethod
+    def field(cls):
+        setattr(cls, cls.get_list_name(), ModelListField(cls.Meta.model))
+        setattr(cls, 'errors', graphene.List(BulkSaveError))
+        return super(BulkSave, cls).field()
+
+    @classmethod
+    def get_arguments(cls):
+        """A list argument `items` of an input with the arguments Save would take, all optional for partial updates."""
+        if 'ItemInput' not in cls.__dict__:
+            item_arguments = {
+                name: type(argument)(*argument.args, **{**argument.kwargs, 'required': False})
+                for name, argument in super(BulkSave, cls).get_arguments().items()
+            }
+            cls.ItemInput = type(f'{cls.__name__}Item', (graphene.InputObjectType,), item_arguments)
+            cls.Meta.arguments = {'items': graphene.List(graphene.NonNull(cls.ItemInput), required=True)}
+        return cls.Meta.arguments
+
+    @classmethod
+    @login_required
+    def mutate(cls, root, info, items):
+        cls.check_permissions(info)
+
+        if len(items) > settings.GRAPHQL_BULK_MAX_ITEMS:
+            raise GraphQLError(f"BulkSave is limited to {settings.GRAPHQL_BULK_MAX_ITEMS} items.")
+
+        instances, errors = cls.get_type().bulk_save([dict(item) for item in items])
+        return cls(**{cls.get_list_name(): instances, 'errors': errors})
+
+
 class Delete(ModelMutation):
     ok = graphene.Boolean()
 
@@ -160,3 +216,45 @@ class Delete(ModelMutation):
     def mutate(cls, root, info, id, *args, **kwargs):
         cls.get_queryset().get(id=id).delete()
         return cls(ok=True)
+
+
+class DeletionCount(graphene.ObjectType):
+    model = graphene.String()
+    action = graphene.String(description='`delete`, `set_null` or `protect` (rows blocking the deletion).')
+    count = graphene.Int()
+
+
+class BulkDelete(ModelMutation):
+    description = 'Delete the objects with `ids` or fitting `django_filter`, `dry_run` only reports the rows it would affect.'
+    ok = graphene.Boolean()
+    deleted = graphene.List(DeletionCount, description='Rows deleted (or nullified) per model, estimated on a dry run.')
+
+    @classmethod
+    def get_arguments(cls):
+        cls.Meta.arguments = {
+            'ids': graphene.List(graphene.ID),
+            'django_filter': DjangoFilter.input,
+            'dry_run': graphene.Boolean(default_value=False),
+        }
+        return cls.Meta.arguments
+
+    @classmethod
+    @login_required
+    def mutate(cls, root, info, ids=None, django_filter=None, dry_run=False):
+        cls.check_permissions(info)
+
+        if ids is None and not django_filter:
+            raise GraphQLError("BulkDelete needs `ids` or a `djangoFilter`, it doesn't delete all objects.")
+
+        qs = cls.get_queryset().all()
+        if ids is not None:
+            qs = qs.filter(id__in=ids)
+        if django_filter:
+            qs = DjangoFilter().apply(qs, dict(django_filter))
+
+        try:
+            if dry_run:
+                return cls(ok=True, deleted=estimate_deletion(qs))
+            return cls(ok=True, deleted=delete_in_chunks(qs, settings.GRAPHQL_BULK_DELETE_CHUNK_SIZE))
+        except (ProtectedError, RestrictedError) as e:
+            raise GraphQLError(e.args[0])
@@ -1,9 +1,18 @@
 
 
+import sys
+
+import promise
+
+from api.exceptions import FieldTimeoutError, TimeoutExit
 from api.meta import meta_base
 
+from django.conf import settings
+
 from funcy import monkey
 from graphql.execution import executor
+from graphql.type import GraphQLNonNull
+from promise import Promise, is_thenable
 from promise.schedulers.immediate import ImmediateScheduler
 
 
@@ -16,6 +25,8 @@ The decorator allows us to change the behaviour of a single method or class
 in any library. This should only be used in extreme cases. It's fukin ugly.
 """
 
+assert promise.VERSION[:2] == (2, 3), "api.patches is written against promise 2.3, check the patches before upgrading."
+
 
 @monkey(executor)
 def execute_fields(*args, **kwargs):
@@ -31,6 +42,99 @@ def execute_fields(*args, **kwargs):
     return execute_fields.original(*args, **kwargs)
 
 
+def _graceful_timeout(exe_context):
+    return settings.GRAPHQL_TIMEOUT_PARTIAL and exe_context.operation.operation == 'query'
+
+
+@monkey(executor)
+def resolve_field(exe_context, parent_type, source, field_asts, parent_info, field_path):
+    """
+    Graceful timeouts (GRAPHQL_TIMEOUT_PARTIAL), root resolvers.
+
+    Dependency: graphql-core==2.3.2, promise==2.3
+
+    A root resolver hitting the timeout resolves to null with a FieldTimeoutError at its path
+    instead of aborting the whole request. The value of a root field is completed (Promise.wait)
+    right after its resolver returns, not after all root resolvers like graphql-core does, so root
+    fields finished before the timeout are kept. Root fields dispatched to RootFieldThreadExecutor
+    are completed in its `wait_until_finished`.
+    """
+    args = exe_context, parent_type, source, field_asts, parent_info, field_path
+
+    if len(field_path) != 1 or not _graceful_timeout(exe_context):
+        return resolve_field.original(*args)
+
+    parallel = getattr(exe_context.executor, 'pending', ())
+    dispatched = len(parallel)
+    try:
+        result = resolve_field.original(*args)
+    except TimeoutExit:
+        exe_context.errors.append(FieldTimeoutError(nodes=field_asts, path=field_path))
+        meta_base.add_timed_out_path(field_path)
+        return None
+
+    if is_thenable(result) and len(parallel) == dispatched:
+        Promise.wait(result)
+    return result
+
+
+@monkey(executor)
+def complete_value(exe_context, return_type, field_asts, info, path, result):
+    """
+    Graceful timeouts (GRAPHQL_TIMEOUT_PARTIAL), sub-selections.
+
+    Dependency: graphql-core==2.3.2
+
+    Values are completed in promise callbacks long after their root resolver returned, so the
+    TimeoutExit is turned into a FieldTimeoutError where it happens, before it can escape a callback.
+    """
+    if not _graceful_timeout(exe_context):
+        return complete_value.original(exe_context, return_type, field_asts, info, path, result)
+
+    try:
+        return complete_value.original(exe_context, return_type, field_asts, info, path, result)
+    except TimeoutExit:
+        raise FieldTimeoutError(nodes=field_asts, path=path)
+
+
+def _is_timeout(error):
+    return isinstance(getattr(error, 'original_error', error), FieldTimeoutError)
+
+
+@monkey(executor)
+def complete_value_catching_error(exe_context, return_type, field_asts, info, path, result):
+    """
+    Graceful timeouts (GRAPHQL_TIMEOUT_PARTIAL), reporting.
+
+    Dependency: graphql-core==2.3.2
+
+    A FieldTimeoutError nulls only the unfinished field (or its closest nullable parent), the items of
+    a list completed before the deadline are kept. The timeout is reported once at the path of the
+    root field, not once per unfinished item. Other errors are reported like graphql-core does.
+    """
+    if not _graceful_timeout(exe_context) or isinstance(return_type, GraphQLNonNull):
+        return complete_value_catching_error.original(exe_context, return_type, field_asts, info, path, result)
+
+    def report(error, traceback):
+        if _is_timeout(error):
+            field_path = path[:1]
+            if field_path in meta_base.get_timed_out_paths():
+                return None
+            meta_base.add_timed_out_path(field_path)
+            error = FieldTimeoutError(nodes=field_asts, path=field_path)
+        exe_context.report_error(error, traceback)
+        return None
+
+    try:
+        completed = executor.complete_value(exe_context, return_type, field_asts, info, path, result)
+    except Exception as e:
+        return report(e, sys.exc_info()[2])
+
+    if is_thenable(completed):
+        return completed.catch(lambda error: report(error, completed._traceback))
+    return completed
+
+
 @monkey(ImmediateScheduler)
 def call(self, fn):
     """
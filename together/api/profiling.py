@@ -0,0 +1,125 @@
+import re
+import threading
+
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from .meta import meta_base
+from .utils import get_request_user
+
+
+"""
+Profiling
+
+Purpose:
+    Opt-in per request performance report returned in `extensions.performance` of the response.
+    Enabled by the GRAPHQL_PROFILING_HEADER for staff users.
+
+    The ProfilingMiddleware times every resolver and marks the resolver path as active,
+    the profiler is a query observer (api.db) attributing each SQL statement to that path.
+"""
+
+_profiler = ContextVar('api_profiler', default=None)
+_resolver_path = ContextVar('api_resolver_path', default=None)
+
+REQUEST_PATH = '(request)'  # statements executed outside of any resolver
+
+_string_literal = re.compile(r"'(?:[^']|'')*'")
+_number_literal = re.compile(r'\b\d+(?:\.\d+)?\b')
+_placeholder_list = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+
+
+def sql_shape(sql):
+    """Normalize a SQL statement so statements differing only in their parameters are equal."""
+    sql = _string_literal.sub('%s', sql)
+    sql = _number_literal.sub('%s', sql)
+    return _placeholder_list.sub('(%s...)', sql)
+
+
+def field_path(info):
+    """Resolver path without list indices, i.e. `events.members.username`."""
+    return '.'.join(str(key) for key in info.path if not isinstance(key, int))
+
+
+class Profiler:
+    """Collects resolver timings, SQL and fetched rows of a single request."""
+
+    def __init__(self):
+        self._lock = threading.Lock()  # root fields can resolve in parallel, see api.executors
+        self.reset()
+
+    def reset(self):
+        """Start collecting the next operation of a batch."""
+        self.resolvers = defaultdict(lambda: {'count': 0, 'time': 0.0})
+        self.sql = defaultdict(lambda: {'count': 0, 'time': 0.0})
+        self.rows = defaultdict(lambda: {'model': None, 'querysets': 0, 'rows': 0})
+        self.shapes = Counter()
+        self.shape_paths = defaultdict(set)
+
+    def record_resolver(self, path, duration):
+        with self._lock:
+            self.resolvers[path]['count'] += 1
+            self.resolvers[path]['time'] += duration
+
+    def record_sql(self, sql, duration):
+        path = _resolver_path.get() or REQUEST_PATH
+        shape = sql_shape(sql)
+        with self._lock:
+            self.sql[path]['count'] += 1
+            self.sql[path]['time'] += duration
+            self.shapes[shape] += 1
+            self.shape_paths[shape].add(path)
+
+    def record_rows(self, path, model, count):
+        with self._lock:
+            self.rows[path]['model'] = model._meta.label
+            self.rows[path]['querysets'] += 1
+            self.rows[path]['rows'] += count
+
+    def n_plus_one(self):
+        """SQL shapes repeated more than GRAPHQL_N_PLUS_ONE_THRESHOLD times."""
+        return [{
+            'sql': shape,
+            'count': count,
+            'paths': sorted(self.shape_paths[shape]),
+        } for shape, count in self.shapes.most_common() if count > settings.GRAPHQL_N_PLUS_ONE_THRESHOLD]
+
+    def report(self):
+        def _rounded(d):
+            return {path: {**values, 'time': round(values['time'], 3)} for path, values in d.items()}
+
+        return {
+            'time': round(meta_base.execution_time(), 3),
+            'resolvers': _rounded(self.resolvers),
+            'sql': {
+                'count': sum(values['count'] for values in self.sql.values()),
+                'time': round(sum(values['time'] for values in self.sql.values()), 3),
+                'paths': _rounded(self.sql),
+            },
+            'rows': dict(self.rows),
+            'nPlusOne': self.n_plus_one(),
+        }
+
+
+def start_profiler():
+    """Start profiling the current request."""
+    profiler = Profiler()
+    _profiler.set(profiler)
+    meta_base.add_query_observer(profiler.record_sql)
+    return profiler
+
+
+def get_profiler():
+    return _profiler.get()
+
+
+def stop_profiler():
+    _profiler.set(None)
+
+
+def profiling_requested(request):
+    if not request.META.get(settings.GRAPHQL_PROFILING_HEADER):
+        return False
+    return getattr(get_request_user(request), 'is_staff', False)
@@ -0,0 +1,139 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .meta import meta_base
+from .metrics import Counter
+
+
+"""
+Rate limiting
+
+Purpose:
+    Token bucket per user (or per client IP for anonymous requests) charged with the cost of every
+    request. Buckets hold up to `capacity` tokens and refill by `rate` tokens per second, both set per
+    tier in GRAPHQL_RATE_LIMIT_TIERS (a tier of None is unlimited).
+
+    GRAPHQL_RATE_LIMIT
+        'static'    the request is charged its api.cost.query_cost before execution and only admitted
+                    when the bucket holds the cost (capped to the capacity, so expensive queries
+                    aren't starved, they overdraw a full bucket)
+        'sql_time'  the request is admitted while the bucket isn't empty and charged the milliseconds
+                    its SQL took afterwards
+        None        disabled
+
+    Rejected requests get a 429 with Retry-After before any resolver runs, see api.views.GraphQLView.
+
+    The buckets live in CACHES[GRAPHQL_RATE_LIMIT_CACHE_ALIAS]: a shared cache (redis, memcached) limits
+    all processes together, a local memory cache limits every process on its own. Reads and writes of
+    a bucket aren't atomic, concurrent requests of the same client may both pass on the last tokens.
+"""
+
+rate_limited_total = Counter('graphql_rate_limited_total', 'Requests rejected by the rate limit.', ('tier',))
+
+
+def rate_limit_enabled():
+    return settings.GRAPHQL_RATE_LIMIT in ('static', 'sql_time')
+
+
+def rate_limit_tier(user):
+    if getattr(user, 'is_staff', False):
+        return 'staff'
+    if getattr(user, 'is_authenticated', False):
+        return 'user'
+    return 'anonymous'
+
+
+def client_identity(request, user):
+    if getattr(user, 'is_authenticated', False):
+        return f'user:{user.pk}'
+    address = request.META.get(settings.GRAPHQL_RATE_LIMIT_IP_HEADER) or request.META.get('REMOTE_ADDR', '')
+    return 'ip:' + address.split(',')[0].strip()  # the client is the first address of X-Forwarded-For
+
+
+class TokenBucket:
+
+    def __init__(self, identity, capacity, rate):
+        self.key = f'graphql:ratelimit:{identity}'
+        self.capacity = capacity
+        self.rate = rate  # tokens per second
+
+    def _cache(self):
+        return caches[settings.GRAPHQL_RATE_LIMIT_CACHE_ALIAS]
+
+    def _load(self, now):
+        tokens, updated = self._cache().get(self.key) or (self.capacity, now)
+        return min(self.capacity, tokens + (now - updated) * self.rate)
+
+    def _store(self, tokens, now):
+        # a bucket not touched until it's full again is the same as no bucket at all
+        timeout = math.ceil((self.capacity - tokens) / self.rate) + 1
+        self._cache().set(self.key, (tokens, now), timeout)
+
+    def acquire(self, amount):
+        """Take `amount` tokens, return the seconds to wait instead when the bucket doesn't hold them."""
+        now = time.time()
+        tokens = self._load(now)
+        required = min(amount, self.capacity) or 1e-9  # an empty bucket admits nothing
+
+        if tokens < required:
+            return math.ceil((required - tokens) / self.rate)
+
+        self._store(tokens - amount, now)
+        return 0
+
+    def charge(self, amount):
+        """Take `amount` tokens after the fact, the bucket may go into debt."""
+        if amount:
+            now = time.time()
+            self._store(self._load(now) - amount, now)
+
+
+class SQLTimer:
+    """Query observer summing the SQL time of the request in ms."""
+
+    def __init__(self):
+        self.sql_time = 0
+
+    def record_sql(self, sql, duration):
+        self.sql_time += duration
+
+
+class RateLimit:
+    """Rate limit of a single request."""
+
+    def __init__(self, request, user):
+        self.tier = rate_limit_tier(user)
+        limits = settings.GRAPHQL_RATE_LIMIT_TIERS.get(self.tier)
+        self.bucket = limits and TokenBucket(client_identity(request, user), limits['capacity'], limits['rate'])
+        self.sql_timer = None
+        self.retry_after = 0
+
+    def admit(self, cost_function):
+        """
+        Charge the request before execution, False when it's rejected (for `retry_after` seconds).
+
+        `cost_function` returns the static cost of the request, it's only called in 'static' mode.
+        """
+        if not self.bucket:
+            return True
+
+        if settings.GRAPHQL_RATE_LIMIT == 'static':
+            self.retry_after = self.bucket.acquire(cost_function())
+        else:
+            self.retry_after = self.bucket.acquire(0)
+            if not self.retry_after:
+                self.sql_timer = SQLTimer()
+                meta_base.add_query_observer(self.sql_timer.record_sql)
+
+        if self.retry_after:
+            rate_limited_total.inc(self.tier)
+            return False
+        return True
+
+    def finish(self):
+        """Charge the measured SQL time in 'sql_time' mode."""
+        if self.sql_timer:
+            self.bucket.charge(self.sql_timer.sql_time)
@@ -483,6 +483,7 @@ class Registry(metaclass=Singleton):
                 prefetch_related = getattr(TypeMeta, 'prefetch_related', [])
                 extra_fields = getattr(TypeMeta, 'extra_fields', [])
                 filters = getattr(TypeMeta, 'filters', {})
+                touch_fields = getattr(TypeMeta, 'touch_fields', [])
 
                 if select_related:
                     TargetType.add_to_meta('select_related', select_related)
@@ -493,6 +494,9 @@ class Registry(metaclass=Singleton):
                 if extra_fields:
                     TargetType.add_to_meta('extra_fields', extra_fields)
 
+                if touch_fields:
+                    TargetType.add_to_meta('touch_fields', touch_fields)
+
                 if filters:
                     meta_filters = getattr(TargetType.Meta, 'filters', dict())
                     meta_filters.update(filters)
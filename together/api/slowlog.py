@@ -0,0 +1,176 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import queue
+import time
+
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from django.conf import settings
+from graphql import parse
+from graphql.error import GraphQLSyntaxError
+from graphql.language import ast
+from graphql.language.printer import print_ast
+
+from .meta import meta_base
+from .utils import get_request_user
+
+
+"""
+Slow operation log
+
+Purpose:
+    Record every GraphQL request slower than GRAPHQL_SLOW_LOG_THRESHOLD with the fingerprint of its
+    document, the shape of its variables, the user, a duration breakdown and the SQL it issued.
+
+    Records are JSON lines written by a logging QueueListener thread, the request only puts the record
+    on a queue. RotatingFileHandler can't share a file between processes, so each process writes to its
+    own GRAPHQL_SLOW_LOG_PATH.<pid>. `./manage.py slow_operations` aggregates the files of all processes.
+"""
+
+LITERAL = ast.Variable(name=ast.Name(value='_'))  # every literal argument value prints as `$_`
+
+
+def _normalize_value(value):
+    if isinstance(value, ast.ObjectValue):
+        fields = [ast.ObjectField(name=field.name, value=_normalize_value(field.value)) for field in value.fields]
+        return ast.ObjectValue(fields=sorted(fields, key=lambda field: field.name.value))
+    if isinstance(value, ast.ListValue):
+        return ast.ListValue(values=[LITERAL])
+    if isinstance(value, ast.Variable):
+        return value
+    return LITERAL
+
+
+def _normalize_selection_set(selection_set):
+    if selection_set is None:
+        return None
+    for selection in selection_set.selections:
+        if isinstance(selection, (ast.Field, ast.InlineFragment)):
+            selection.selection_set = _normalize_selection_set(selection.selection_set)
+        if isinstance(selection, ast.Field):
+            for argument in selection.arguments:
+                argument.value = _normalize_value(argument.value)
+            selection.arguments = sorted(selection.arguments, key=lambda argument: argument.name.value)
+    selection_set.selections = sorted(selection_set.selections, key=print_ast)
+    return selection_set
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(query):
+    """
+    Return (fingerprint, normalized document) of a GraphQL document.
+
+    Literals are replaced by `$_` and fields and arguments are sorted, so documents only differing
+    in their literal values or field order share the fingerprint.
+    """
+    try:
+        document = parse(query)
+    except GraphQLSyntaxError:
+        return hashlib.sha256(query.encode('utf-8')).hexdigest()[:16], query
+
+    for definition in document.definitions:
+        definition.selection_set = _normalize_selection_set(definition.selection_set)
+
+    normalized = print_ast(document)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()[:16], normalized
+
+
+def variables_shape(value):
+    """Variables with their values replaced by type names, i.e. {'ids': ['str']}."""
+    if isinstance(value, dict):
+        return {key: variables_shape(item) for key, item in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [variables_shape(value[0])] if value else []
+    return type(value).__name__
+
+
+class StatementLog:
+    """Query observer keeping the first GRAPHQL_SLOW_LOG_MAX_STATEMENTS statements of the request."""
+
+    def __init__(self):
+        self.statements = []
+        self.count = 0
+        self.time = 0.0
+
+    def record_sql(self, sql, duration):
+        self.count += 1
+        self.time += duration
+        if len(self.statements) < settings.GRAPHQL_SLOW_LOG_MAX_STATEMENTS:
+            self.statements.append({'sql': sql, 'time': round(duration, 3)})
+
+
+def slow_log_enabled():
+    return settings.GRAPHQL_SLOW_LOG_THRESHOLD is not None
+
+
+def start_statement_log():
+    statement_log = StatementLog()
+    meta_base.add_query_observer(statement_log.record_sql)
+    return statement_log
+
+
+_listener = None  # (pid, QueueListener), a forked process starts its own
+
+
+def get_logger():
+    """Logger handing records to a background thread, which writes them to the rotating log file of the process."""
+    global _listener
+
+    logger = logging.getLogger('api.slowlog')
+    pid = os.getpid()
+
+    if _listener is None or _listener[0] != pid:
+        path = f'{settings.GRAPHQL_SLOW_LOG_PATH}.{pid}'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file_handler = RotatingFileHandler(
+            path,
+            maxBytes=settings.GRAPHQL_SLOW_LOG_MAX_BYTES,
+            backupCount=settings.GRAPHQL_SLOW_LOG_BACKUP_COUNT,
+        )
+        records = queue.Queue(-1)
+        listener = QueueListener(records, file_handler)
+        listener.start()
+        atexit.register(listener.stop)  # writes the records still queued
+        _listener = (pid, listener)
+
+        for handler in list(logger.handlers):  # the queue of the parent process
+            logger.removeHandler(handler)
+        logger.addHandler(QueueHandler(records))
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+    return logger
+
+
+def log_if_slow(request, query, variables, operation_name, success, statement_log):
+    """Record the request in the slow log when it took longer than GRAPHQL_SLOW_LOG_THRESHOLD."""
+    total = meta_base.execution_time()
+
+    if not query or total < settings.GRAPHQL_SLOW_LOG_THRESHOLD:
+        return
+
+    operation_fingerprint, document = fingerprint(query)
+    user = get_request_user(request)
+
+    record = {
+        'time': time.time(),
+        'fingerprint': operation_fingerprint,
+        'operation': operation_name,
+        'document': document,
+        'variables': variables_shape(variables or {}),
+        'user': user.id if getattr(user, 'is_authenticated', False) else None,
+        'success': success,
+        'duration': {
+            'total': round(total, 3),
+            'sql': round(statement_log.time, 3),
+            'other': round(total - statement_log.time, 3),
+        },
+        'sqlCount': statement_log.count,
+        'sql': statement_log.statements,
+    }
+
+    get_logger().info(json.dumps(record, default=str))
@@ -0,0 +1,204 @@
+import logging
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.http import StreamingHttpResponse
+from graphene_django.types import DjangoObjectType
+from graphql import parse, validate
+from graphql.error import GraphQLSyntaxError
+from graphql.language import ast
+from graphql.type import GraphQLList, GraphQLNonNull, GraphQLScalarType
+
+from .db import request_queries
+from .encoders import get_encoder
+from .exceptions import TimeoutExit
+from .filters import FilterSet
+from .meta import request_scope
+from .parsing import get_selection
+from .types import BaseType
+from .utils import get_request_user
+
+from utils.string import camel_to_snake
+
+
+"""
+Streaming
+
+Purpose:
+    Opt-in (GRAPHQL_STREAM_HEADER) streaming of large list queries like `{ users { id username } }`.
+
+    A query qualifies when its only root field is a model list field and every sub-field is a scalar
+    model column without a custom resolver. The filtered queryset is then read with
+    `.values_list().iterator(chunk_size=GRAPHQL_STREAM_CHUNK_SIZE)` (a server-side cursor on PostgreSQL)
+    and encoded chunk by chunk into a StreamingHttpResponse, no model instances, graphene result tree
+    or full JSON string are built. Any other query falls back to the regular execution.
+
+    The stream is sent after the view and the middlewares returned, so it opens its own request scope
+    with the statement timeouts of api.db, GRAPHQL_TIMEOUT counts from the first chunk. The admission
+    slot of the request is held until the response is closed.
+"""
+
+
+logger = logging.getLogger(__name__)
+
+
+class StreamedField:
+    """Root list field of a streamable query."""
+
+    def __init__(self, key, NodeType, selection, columns):
+        self.key = key  # response key, the alias or the field name
+        self.NodeType = NodeType
+        self.selection = selection
+        self.columns = columns  # [(response key, model attname, scalar type)]
+
+    def queryset(self):
+        filters = dict(self.selection.filters)
+        filters.pop('meta', None)
+        filter_set = FilterSet(getattr(self.NodeType.Meta, 'filters', {}), **filters)
+
+        Model = self.NodeType.Meta.model
+        qs = getattr(self.NodeType.Meta, 'queryset', Model.objects.all())
+        return filter_set.apply(qs)
+
+    def rows(self):
+        qs = self.queryset().values_list(*[attname for key, attname, scalar in self.columns])
+        for values in qs.iterator(chunk_size=settings.GRAPHQL_STREAM_CHUNK_SIZE):
+            yield {
+                key: None if value is None else scalar.serialize(value)
+                for (key, attname, scalar), value in zip(self.columns, values)
+            }
+
+
+def streaming_requested(request):
+    return bool(request.META.get(settings.GRAPHQL_STREAM_HEADER))
+
+
+def _unwrap(graphql_type):
+    return graphql_type.of_type if isinstance(graphql_type, GraphQLNonNull) else graphql_type
+
+
+def _column(NodeType, object_type, field):
+    """Return (response key, attname, scalar type) of a plain model column sub-field, None otherwise."""
+    if not isinstance(field, ast.Field) or field.arguments or field.directives or field.selection_set:
+        return None
+
+    name = field.name.value
+    scalar = _unwrap(object_type.fields[name].type)
+    attribute = camel_to_snake(name)
+
+    if not isinstance(scalar, GraphQLScalarType):
+        return None
+
+    try:
+        model_field = NodeType.Meta.model._meta.get_field(attribute)
+    except FieldDoesNotExist:
+        return None
+    if not model_field.concrete or model_field.is_relation:
+        return None
+
+    resolver = getattr(NodeType, f'resolve_{attribute}', None)
+    plain_resolvers = (None, DjangoObjectType.resolve_id if model_field.primary_key else None)
+    if resolver not in plain_resolvers and getattr(resolver, 'attribute', None) != attribute:
+        return None  # custom resolver, plain getattr resolvers read the column as well
+
+    key = field.alias.value if field.alias else name
+    return key, model_field.attname, scalar
+
+
+def get_streamed_field(schema, query, variables):
+    """Return the StreamedField of a streamable query, None if it has to be executed regularly."""
+    try:
+        document = parse(query)
+    except GraphQLSyntaxError:
+        return None
+
+    if len(document.definitions) != 1 or validate(schema, document):
+        return None
+
+    operation = document.definitions[0]
+    if not isinstance(operation, ast.OperationDefinition) or operation.operation != 'query' or operation.directives:
+        return None
+
+    if len(operation.selection_set.selections) != 1:
+        return None
+    root = operation.selection_set.selections[0]
+    if not isinstance(root, ast.Field) or root.directives or not root.selection_set:
+        return None
+
+    list_type = _unwrap(schema.get_query_type().fields[root.name.value].type)
+    if not isinstance(list_type, GraphQLList):
+        return None
+    object_type = _unwrap(list_type.of_type)
+    NodeType = getattr(object_type, 'graphene_type', None)
+    if not (isinstance(NodeType, type) and issubclass(NodeType, BaseType)):
+        return None
+
+    columns = [_column(NodeType, object_type, field) for field in root.selection_set.selections]
+    if not columns or None in columns:
+        return None
+
+    key = root.alias.value if root.alias else root.name.value
+    selection = get_selection(operation.selection_set, variables or {}, {}, operation_name=key)
+    return StreamedField(key, NodeType, selection, columns)
+
+
+def _stream(streamed_field):
+    encode = get_encoder()
+
+    def _bytes(value):
+        return value.encode('utf-8') if isinstance(value, str) else value
+
+    yield b'{"data":{' + _bytes(encode(streamed_field.key)) + b':['
+
+    chunk, first = [], True
+    try:
+        with request_scope(), request_queries():
+            for row in streamed_field.rows():
+                chunk.append(row)
+                if len(chunk) >= settings.GRAPHQL_STREAM_CHUNK_SIZE:
+                    yield (b'' if first else b',') + _bytes(encode(chunk))[1:-1]  # list items without the brackets
+                    chunk, first = [], False
+            if chunk:
+                yield (b'' if first else b',') + _bytes(encode(chunk))[1:-1]
+    except (Exception, TimeoutExit) as e:
+        # the status is already sent, close the JSON and report the error in it
+        if isinstance(e, TimeoutExit):
+            message = f"The request timed out (>{settings.GRAPHQL_TIMEOUT}ms)."
+        else:
+            logger.exception("Streaming of %s failed.", streamed_field.key)
+            message = "The stream was interrupted by a server error."
+        yield b']},' + _bytes(encode({'errors': [{'message': message}], 'success': 'PARTIAL'}))[1:]
+        return
+
+    yield b']},' + _bytes(encode({'success': 'FULL'}))[1:]
+
+
+class StreamedContent:
+    """Streaming content of a response, closes the request resources (i.e. its admission slot) with the response."""
+
+    def __init__(self, streamed_field, resources):
+        self.chunks = _stream(streamed_field)
+        self.resources = resources  # ExitStack
+
+    def __iter__(self):
+        return self.chunks
+
+    def close(self):
+        self.chunks.close()
+        self.resources.close()
+
+
+def stream_response(request, schema, query, variables, resources):
+    """
+    Return a StreamingHttpResponse for a streamable query of an authenticated user, None otherwise.
+
+    The contexts entered in the `resources` ExitStack move to the response and are exited when it's closed.
+    """
+    if not getattr(get_request_user(request), 'is_authenticated', False):
+        return None  # the regular execution reports the permission error
+
+    streamed_field = get_streamed_field(schema, query, variables)
+    if streamed_field is None:
+        return None
+
+    return StreamingHttpResponse(StreamedContent(streamed_field, resources.pop_all()), content_type='application/json')
@@ -0,0 +1,573 @@
+import json
+import os
+import tempfile
+import threading
+
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.db.models.deletion import ProtectedError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from config.schema import schema  # noqa: F401, registers the types
+from chats.models import Chat, Message
+from core.models import Image, RenditionTask
+from core.tests import MediaTestCase, image_file
+from events.models import Event
+from locations.models import Location
+from organisations.models import Organisation
+from users.models import User
+from utils import deletion
+
+from graphql import parse
+
+from . import parsing
+from .admission import AdmissionController, CostClass, Overloaded
+from .cache import TableWriteWrapper, install_table_write_wrapper, plan_tables
+from .cost import query_cost
+from .db import RequestQueryWrapper, request_queries
+from .idempotency import check_idempotency_cache
+from .meta import MetaBase, meta_base, request_scope
+from .metering import UsageBuffer
+from .metrics import registry
+from .ratelimit import TokenBucket
+from .registry import get_global_registry
+from .streaming import StreamedField
+
+
+def get_type(Model):
+    return get_global_registry().get_type_for_model(Model)
+
+
+class BulkSaveTest(MediaTestCase):
+
+    def test_upload_is_stored(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            (image,), errors = get_type(Image).bulk_save([{'name': 'upload', 'image': image_file('upload', (60, 40))}])
+
+        self.assertEqual(errors, [])
+        image.refresh_from_db()
+        self.assertTrue(image.image.storage.exists(image.image.name))
+        self.assertEqual((image.width, image.height, image.format), (60, 40, 'JPEG'))
+        self.assertTrue(RenditionTask.objects.filter(image=image).exists())
+
+    def test_bulk_insert_runs_save(self):
+        with mock.patch.object(connection.features, 'can_return_rows_from_bulk_insert', True), \
+                self.captureOnCommitCallbacks(execute=True):
+            (image,), errors = get_type(Image).bulk_save([{'name': 'inserted', 'image': image_file('inserted')}])
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Image.objects.get(pk=image.pk).width, 120)
+        self.assertTrue(RenditionTask.objects.filter(image=image).exists())
+
+    def test_update_of_file_stores_derived_fields(self):
+        image = Image.objects.create(name='replaced', image=image_file('replaced'))
+
+        get_type(Image).bulk_save([{'id': image.pk, 'image': image_file('replacement', (30, 20), 'PNG')}])
+
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height, image.format), (30, 20, 'PNG'))
+        self.assertIsNone(image.warmed_at)
+
+    def test_unique_values(self):
+        Image.objects.create(name='taken', image=image_file('taken'))
+
+        instances, errors = get_type(Image).bulk_save([
+            {'name': 'taken', 'image': image_file('a')},
+            {'name': 'twice', 'image': image_file('b')},
+            {'name': 'twice', 'image': image_file('c')},
+            {'name': 'free', 'image': image_file('d')},
+        ])
+
+        self.assertEqual(instances, [None] * 4)
+        self.assertEqual([(error['index'], error['field']) for error in errors], [(0, 'name'), (2, 'name')])
+        self.assertEqual(Image.objects.count(), 1)
+
+    def test_unchanged_unique_value_is_no_error(self):
+        image = Image.objects.create(name='kept', image=image_file('kept'))
+
+        instances, errors = get_type(Image).bulk_save([{'id': image.pk, 'name': 'kept'}])
+
+        self.assertEqual(errors, [])
+        self.assertEqual(instances, [image])
+
+
+def create_event(title='event'):
+    location = Location.objects.create(name='location', category='town')
+    organisation = Organisation.objects.create(name=title, category='music', location=location)
+    return Event.objects.create(title=title, organisation=organisation)
+
+
+class PlainUpdateTest(TestCase):
+
+    def setUp(self):
+        self.chat = Chat.objects.create(name='chat')
+
+    def save(self, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            get_type(Chat).save(id=self.chat.pk, **kwargs)
+        return [query['sql'].split(None, 1)[0] for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+
+    def test_update_without_select(self):
+        statements = self.save(name='renamed')
+
+        self.assertEqual(statements[:1], ['UPDATE'])  # no SELECT of the instance before
+        updated = Chat.objects.get(pk=self.chat.pk)
+        self.assertEqual(updated.name, 'renamed')
+        self.assertGreater(updated.modified, self.chat.modified)
+
+    def test_unchanged_values_write_nothing(self):
+        self.save(name='chat')
+
+        self.assertEqual(Chat.objects.get(pk=self.chat.pk).modified, self.chat.modified)  # the row wasn't touched
+
+    def test_missing_object(self):
+        with self.assertRaises(Chat.DoesNotExist):
+            get_type(Chat).save(id=self.chat.pk + 1, name='missing')
+
+
+class NestedDataTest(MediaTestCase):
+
+    def test_nested_uploads_are_saved(self):
+        event = create_event()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            get_type(Event)._apply_m2m_action(event, 'gallery', 'add', data=[
+                {'name': 'first', 'image': image_file('first', (50, 50))},
+                {'name': 'second', 'image': image_file('second', (70, 50))},
+            ])
+
+        gallery = event.gallery.order_by('name')
+        self.assertEqual([(image.name, image.width) for image in gallery], [('first', 50), ('second', 70)])
+        self.assertTrue(all(image.image.storage.exists(image.image.name) for image in gallery))
+        self.assertEqual(RenditionTask.objects.count(), 2)
+
+
+class M2MActionTest(TestCase):
+
+    def setUp(self):
+        self.event = create_event()
+        self.images = [Image.objects.create(name=f'image {i}', image=f'images/{i}.jpg') for i in range(3)]
+        self.through = Event.gallery.through
+
+    def gallery_rows(self, event=None):
+        return dict(self.through.objects.filter(event=event or self.event).values_list('image_id', 'id'))
+
+    def test_set_keeps_the_rows_that_stay(self):
+        first, second, third = self.images
+        self.event.gallery.set([first, second])
+        kept = self.gallery_rows()[second.pk]
+
+        get_type(Event)._apply_m2m_action(self.event, 'gallery', 'set', ids=[second.pk, third.pk])
+
+        rows = self.gallery_rows()
+        self.assertEqual(set(rows), {second.pk, third.pk})
+        self.assertEqual(rows[second.pk], kept)
+
+    def test_add_skips_existing_pairs(self):
+        self.event.gallery.add(self.images[0])
+
+        get_type(Event)._apply_m2m_action(self.event, 'gallery', 'add', ids=[image.pk for image in self.images])
+
+        self.assertEqual(self.through.objects.filter(event=self.event).count(), 3)
+
+    def test_bulk_action(self):
+        other = Event.objects.create(title='other', organisation=self.event.organisation)
+        self.event.gallery.add(self.images[0])
+
+        get_type(Event).bulk_apply_m2m_action(Event.objects.all(), 'gallery', 'set', [self.images[1].pk])
+
+        self.assertEqual(set(self.gallery_rows()), {self.images[1].pk})
+        self.assertEqual(set(self.gallery_rows(other)), {self.images[1].pk})
+
+        get_type(Event).bulk_apply_m2m_action(Event.objects.filter(pk=other.pk), 'gallery', 'clean')
+        self.assertEqual(self.gallery_rows(other), {})
+
+
+@override_settings(GRAPHQL_TIMEOUT_PARTIAL=True)
+class GracefulTimeoutTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='staff', is_staff=True, is_superuser=True)
+        for i in range(3):
+            create_event(f'event {i}')
+        self.client.force_login(self.user)
+        self.expired = False
+
+    def query(self, query):
+        with mock.patch.object(MetaBase, 'execution_time', lambda meta: 10 ** 6 if self.expired else 0):
+            response = self.client.post('/graphql', json.dumps({'query': query}), content_type='application/json')
+        return response.json()
+
+    def test_completed_root_fields_are_kept(self):
+        def selection_from_info(info, **kwargs):
+            self.expired = self.expired or info.field_name == 'events'  # the deadline passes in the events resolver
+            return parsing.selection_from_info(info, **kwargs)
+
+        with mock.patch('api.factories.selection_from_info', selection_from_info):
+            response = self.query('{ a: users { id } b: events { id title } }')
+
+        self.assertEqual(response['data'], {'a': [{'id': str(self.user.pk)}], 'b': None})
+        self.assertEqual([error['path'] for error in response['errors']], [['b']])
+
+    def test_completed_items_are_kept(self):
+        def get_name(organisation):
+            self.expired = True  # the deadline passes while the first event is completed
+            return organisation.__dict__['name']
+
+        def set_name(organisation, value):
+            organisation.__dict__['name'] = value
+
+        with mock.patch.object(Organisation, 'name', property(get_name, set_name)):
+            response = self.query('{ events { id organisation { name } } }')
+
+        events = response['data']['events']
+        self.assertEqual([event['organisation'] is not None for event in events], [True, False, False])
+        self.assertTrue(all(event['id'] for event in events))  # only the unfinished subtrees are nulled
+        self.assertEqual([error['path'] for error in response['errors']], [['events']])
+
+
+@override_settings(GRAPHQL_STATEMENT_TIMEOUT_SLACK=50)
+class StatementTimeoutTest(SimpleTestCase):
+
+    def sent_timeouts(self, remaining_times, in_atomic_block=False):
+        wrapper = RequestQueryWrapper(mock.Mock(vendor='postgresql', in_atomic_block=in_atomic_block))
+        cursor = mock.Mock()
+        for remaining in remaining_times:
+            wrapper._set_statement_timeout(cursor, remaining)
+        return [call.args[1][0] for call in cursor.execute.call_args_list]
+
+    def test_session_timeout_follows_the_deadline(self):
+        self.assertEqual(self.sent_timeouts([1000, 980, 950, 940, 800, 760, 30]), [1000, 940, 800, 30])
+
+    def test_transactions_set_every_statement(self):
+        self.assertEqual(self.sent_timeouts([1000, 990], in_atomic_block=True), [1000, 990])
+
+
+class IdempotencyTest(TestCase):
+    send = 'sendChatMessage(chat: $chat, sender: $sender, text: $text, idempotencyKey: $key) { message { id } }'
+
+    def setUp(self):
+        caches[settings.GRAPHQL_IDEMPOTENCY_CACHE_ALIAS].clear()
+        self.user = User.objects.create(username='sender')
+        self.chat = Chat.objects.create(name='chat')
+        self.client.force_login(self.user)
+
+    def test_cache_has_to_be_shared(self):
+        def check(backend):
+            with self.settings(CACHES={settings.GRAPHQL_IDEMPOTENCY_CACHE_ALIAS: {'BACKEND': backend}}):
+                return [error.id for error in check_idempotency_cache(None)]
+
+        self.assertEqual(check('django.core.cache.backends.locmem.LocMemCache'), ['api.W001'])
+        self.assertEqual(check('django.core.cache.backends.dummy.DummyCache'), ['api.E001'])
+        self.assertEqual(check('django.core.cache.backends.memcached.PyMemcacheCache'), [])
+
+    def mutate(self, selections, text='hello', key=None, **headers):
+        query = f'mutation($chat: ID!, $sender: ID!, $text: String!, $key: String) {{ {selections} }}'
+        variables = {'chat': self.chat.pk, 'sender': self.user.pk, 'text': text, 'key': key}
+        response = self.client.post('/graphql', json.dumps({'query': query, 'variables': variables}), content_type='application/json', **headers)
+        return response.json()
+
+    def test_retry_returns_the_stored_payload(self):
+        first = self.mutate(self.send, key='retry')
+        retry = self.mutate(self.send, HTTP_IDEMPOTENCY_KEY='retry')
+
+        self.assertEqual(retry['data'], first['data'])
+        self.assertEqual(Message.objects.count(), 1)
+
+    def test_key_reused_with_other_arguments(self):
+        self.mutate(self.send, key='reused')
+        response = self.mutate(self.send, text='changed', key='reused')
+
+        self.assertIn('different arguments', response['errors'][0]['message'])
+        self.assertEqual(Message.objects.count(), 1)
+
+    def test_aliased_mutations_sharing_the_header_key(self):
+        response = self.mutate(f'first: {self.send} second: {self.send}', HTTP_IDEMPOTENCY_KEY='shared')
+
+        self.assertNotIn('errors', response)
+        self.assertNotEqual(response['data']['first'], response['data']['second'])
+        self.assertEqual(Message.objects.count(), 2)
+
+
+class ChunkedDeletionTest(TestCase):
+
+    def setUp(self):
+        self.locations = [Location.objects.create(name=f'location {i}', category='town') for i in range(3)]
+
+    def protect_last(self):
+        Organisation.objects.create(name='protecting', category='music', location=self.locations[-1])
+
+    def test_protected_object_stops_the_deletion_before_the_first_chunk(self):
+        self.protect_last()
+
+        with self.assertRaises(ProtectedError):
+            deletion.delete_in_chunks(Location.objects.all(), 1)  # self cascade, goes through the Collector
+        self.assertEqual(Location.objects.count(), 3)
+
+        tree = [(Organisation._meta.get_field('location'), 'protect', [])]
+        with mock.patch.object(deletion, 'relation_tree', return_value=tree), self.assertRaises(ProtectedError):
+            deletion.delete_in_chunks(Location.objects.all(), 1)  # set-based deletes
+        self.assertEqual(Location.objects.count(), 3)
+
+    def test_estimate_reports_protected_rows(self):
+        self.protect_last()
+
+        report = deletion.estimate_deletion(Location.objects.all())
+
+        self.assertEqual(report, [
+            {'model': 'locations.Location', 'action': 'delete', 'count': 3},
+            {'model': 'organisations.Organisation', 'action': 'protect', 'count': 1},
+        ])
+
+    def test_cascades_in_chunks(self):
+        events = [create_event(f'event {i}') for i in range(3)]
+        organisations = Organisation.objects.filter(pk__in=[event.organisation_id for event in events])
+
+        estimate = deletion.estimate_deletion(organisations)
+        report = deletion.delete_in_chunks(organisations, 2)
+
+        self.assertIn({'model': 'events.Event', 'action': 'delete', 'count': 3}, estimate)
+        self.assertIn({'model': 'events.Event', 'action': 'delete', 'count': 3}, report)
+        self.assertIn({'model': 'organisations.Organisation', 'action': 'delete', 'count': 3}, report)
+        self.assertFalse(Event.objects.exists())
+
+
+@override_settings(GRAPHQL_COST_LIST_SIZE=50, GRAPHQL_COST_MAX_LIST_SIZE=1000)
+class QueryCostTest(SimpleTestCase):
+
+    def cost(self, query):
+        return query_cost(schema, parse(query))
+
+    def test_list_sizes(self):
+        self.assertEqual(self.cost('{ events { id organisation { name } } }'), 1 + 50)
+        self.assertEqual(self.cost('{ events(ids: [1, 2]) { id organisation { name } } }'), 1 + 2)
+        self.assertEqual(self.cost('{ events(pagination: {limitTo: 200}) { id organisation { name } } }'), 1 + 200)
+        self.assertEqual(self.cost('{ events(pagination: {limitTo: 5000}) { id organisation { name } } }'), 1 + 1000)
+
+    def test_scalars_are_free(self):
+        self.assertEqual(self.cost('{ events { id title } }'), 1)
+
+
+@override_settings(
+    GRAPHQL_RATE_LIMIT='static',
+    GRAPHQL_RATE_LIMIT_TIERS={'anonymous': None, 'user': {'capacity': 100, 'rate': 1}, 'staff': None},
+)
+class RateLimitTest(TestCase):
+
+    def setUp(self):
+        caches[settings.GRAPHQL_RATE_LIMIT_CACHE_ALIAS].clear()
+
+    def test_bucket_refills(self):
+        bucket = TokenBucket('test', capacity=10, rate=2)
+
+        with mock.patch('api.ratelimit.time.time', return_value=1000):
+            self.assertEqual(bucket.acquire(8), 0)
+            self.assertEqual(bucket.acquire(6), 2)  # 2 tokens left, 4 missing at 2 per second
+        with mock.patch('api.ratelimit.time.time', return_value=1002):
+            self.assertEqual(bucket.acquire(6), 0)
+
+    def test_expensive_query_overdraws_a_full_bucket(self):
+        self.client.force_login(User.objects.create(username='user'))
+        query = json.dumps({'query': '{ events(pagination: {limitTo: 200}) { id organisation { name } } }'})
+
+        first = self.client.post('/graphql', query, content_type='application/json')
+        second = self.client.post('/graphql', query, content_type='application/json')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 429)
+        self.assertGreater(int(second['Retry-After']), 100)
+
+
+class RequestScopeTest(SimpleTestCase):
+
+    def test_no_state_is_kept_outside_of_a_scope(self):
+        meta_base.add_warning('outside')
+        self.assertEqual(meta_base.get_warnings(), [])
+
+        with request_scope():
+            meta_base.add_warning('inside')
+            self.assertEqual(meta_base.get_warnings(), ['inside'])
+        self.assertEqual(meta_base.get_warnings(), [])
+
+
+class UsageBufferTest(SimpleTestCase):
+
+    @override_settings(GRAPHQL_USAGE_FLUSH_INTERVAL=0.05)
+    def test_idle_buffer_is_flushed(self):
+        written = threading.Event()
+        usage = {'calls': 1, 'wall_time': 1.0, 'sql_time': 0.5, 'sql_count': 1, 'rows': 1}
+
+        with mock.patch.object(UsageBuffer, '_write', side_effect=lambda records: written.set()) as write:
+            buffer = UsageBuffer()
+            buffer.add(None, {'events': usage})
+            self.assertTrue(written.wait(5))  # no further add() call
+
+        (records,), _ = write.call_args
+        self.assertEqual([(record.key, record.calls) for record in records], [('events', 1)])
+
+
+class PlanTablesTest(SimpleTestCase):
+
+    def plan(self, query):
+        return plan_tables(schema, parse(query))
+
+    def test_selected_tables(self):
+        self.assertEqual(
+            self.plan('{ events(pagination: {limitTo: 5}) { id title organisation { name } gallery { id } } }'),
+            {'events_event', 'organisations_organisation', 'core_image', 'events_event_gallery'},
+        )
+
+    def test_filters_and_custom_resolvers_are_unknown(self):
+        self.assertIsNone(self.plan('{ events(djangoFilter: {filter: "{\'organisation__location__name\': \'x\'}"}) { id } }'))
+        self.assertIsNone(self.plan('{ events { id members { id } } }'))
+
+
+class TableWriteWrapperTest(SimpleTestCase):
+
+    def test_blank_statement(self):
+        wrapper = TableWriteWrapper(mock.Mock())
+        execute = mock.Mock(return_value='result')
+
+        self.assertEqual(wrapper(execute, '  ', None, False, {}), 'result')
+        wrapper.connection.on_commit.assert_not_called()
+
+    def test_connection_opened_by_a_request(self):
+        new_connection = connections.create_connection('default')
+        connection_created.connect(install_table_write_wrapper, dispatch_uid='api_table_write_wrapper')
+        if not (settings.GRAPHQL_RESPONSE_CACHE or settings.GRAPHQL_ETAGS):  # not connected by ApiConfig
+            self.addCleanup(connection_created.disconnect, dispatch_uid='api_table_write_wrapper')
+        try:
+            with mock.patch('api.db.connections.all', return_value=[new_connection]), request_queries():
+                new_connection.ensure_connection()
+        finally:
+            new_connection.close()
+
+        self.assertEqual([type(wrapper) for wrapper in new_connection.execute_wrappers], [TableWriteWrapper])
+
+    def test_write_is_recorded(self):
+        wrapper = TableWriteWrapper(mock.Mock())
+
+        wrapper(mock.Mock(), 'UPDATE "events_event" SET "title" = %s', ['title'], False, {})
+        wrapper.connection.on_commit.assert_called_once()
+
+
+@override_settings(
+    GRAPHQL_ADMISSION_QUEUE_SIZE=1,
+    GRAPHQL_ADMISSION_MIN_BUDGET=200,
+    GRAPHQL_ADMISSION_CLASSES={'light': {'max_cost': 100, 'limit': 1}, 'heavy': {'max_cost': None, 'limit': 1}},
+)
+class AdmissionTest(SimpleTestCase):
+
+    def remaining_time(self, ms):
+        return mock.patch.object(MetaBase, 'remaining_time', return_value=ms)
+
+    def test_cost_classes(self):
+        controller = AdmissionController()
+        self.assertEqual([controller.cost_class(cost) for cost in (1, 100, 101)], ['light', 'light', 'heavy'])
+
+    def test_waiter_gets_the_released_slot(self):
+        cost_class = CostClass('light', 1)
+        cost_class.acquire()
+        admitted = threading.Event()
+
+        def wait():
+            cost_class.acquire()
+            admitted.set()
+
+        with self.remaining_time(10000):
+            waiter = threading.Thread(target=wait)
+            waiter.start()
+            self.assertFalse(admitted.wait(0.05))
+            cost_class.release()
+            self.assertTrue(admitted.wait(5))
+            waiter.join()
+        self.assertEqual(cost_class.in_flight, 1)
+
+    def test_shed_when_the_budget_would_run_out(self):
+        cost_class = CostClass('light', 1)
+        cost_class.acquire()
+
+        with self.remaining_time(150), self.assertRaises(Overloaded) as shed:
+            cost_class.acquire()
+        self.assertEqual(shed.exception.reason, 'deadline')
+        self.assertEqual(cost_class.waiting, 0)
+
+    def test_shed_when_the_queue_is_full(self):
+        cost_class = CostClass('light', 1)
+        cost_class.acquire()
+        cost_class.waiting = 1  # another request is queued already
+
+        with self.assertRaises(Overloaded) as shed:
+            cost_class.acquire()
+        self.assertEqual(shed.exception.reason, 'queue_full')
+
+
+@override_settings(GRAPHQL_ADMISSION=True)
+class StreamingTest(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create(username='user'))
+        self.controller = AdmissionController()
+        patcher = mock.patch('api.views.admission_controller', self.controller)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stream(self):
+        query = json.dumps({'query': '{ users { id username } }'})
+        response = self.client.post('/graphql', query, content_type='application/json', HTTP_X_GRAPHQL_STREAM='1')
+        self.assertTrue(response.streaming)
+        return response
+
+    def in_flight(self):
+        return sum(cost_class.in_flight for cost_class in self.controller._classes.values())
+
+    def test_stream_holds_the_admission_slot_and_the_statement_budget(self):
+        response = self.stream()
+        self.assertEqual(self.in_flight(), 1)
+
+        with mock.patch.object(MetaBase, 'remaining_time', return_value=0):
+            content = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(content['success'], 'PARTIAL')
+        self.assertIn('timed out', content['errors'][0]['message'])
+        self.assertEqual(self.in_flight(), 0)
+
+    def test_errors_are_not_exposed(self):
+        response = self.stream()
+        with mock.patch.object(StreamedField, 'rows', side_effect=ValueError('secret')), self.assertLogs('api.streaming'):
+            content = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(content['success'], 'PARTIAL')
+        self.assertNotIn('secret', content['errors'][0]['message'])
+
+
+class MetricsTest(TestCase):
+
+    def test_view_is_off_by_default(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    @override_settings(GRAPHQL_METRICS=True, GRAPHQL_METRICS_TOKEN='scraper')
+    def test_view_needs_staff_or_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scraper').status_code, 200)
+
+        self.client.force_login(User.objects.create(username='staff', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_gauges_of_a_reused_pid_are_dropped(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(GRAPHQL_METRICS_DIR=directory):
+            dead = {
+                'graphql_admission_queue_depth': [[['dead'], 5]],
+                'graphql_admission_shed_total': [[['dead', 'queue_full'], 2]],
+            }
+            with open(os.path.join(directory, f'metrics_{os.getpid()}_1.json'), 'w') as f:  # same pid, earlier process
+                json.dump(dead, f)
+
+            collected = registry.collect()
+
+            self.assertEqual(len(os.listdir(directory)), 2)  # this process dumps next to it
+        self.assertNotIn(('dead',), collected['graphql_admission_queue_depth'])
+        self.assertEqual(collected['graphql_admission_shed_total'][('dead', 'queue_full')], 2)
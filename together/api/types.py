@@ -1,15 +1,24 @@
-from django.db import transaction
-from django.db.models import Model as DjangoModel
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.contrib.postgres.fields.citext import CIText
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
+from django.db.models import FileField, Model as DjangoModel, Q, QuerySet, signals
 from django.db.models.fields.related_descriptors import (
     ForwardManyToOneDescriptor,
     ForwardOneToOneDescriptor,
     ManyToManyDescriptor,
     ReverseManyToOneDescriptor,
 )
+from django.utils import timezone
 
 import graphene
 
 from api.exceptions import NodeNotFound
+from utils.core import chunks
 from utils.string import camel_to_snake
 
 from .factories import getattr_resolver_factory, qs_resolver_factory
@@ -201,12 +210,12 @@ class BaseType:
                 instance = cls.Meta.model.objects.create(**kwargs)
             else:
                 pk = kwargs.pop('id')
-                instance = cls.Meta.model.objects.get(id=pk)
-                if kwargs:
-                    for key, val in kwargs.items():
-                        setattr(instance, key, val)
-                    instance.clean_fields()
-                    instance.save()
+                if kwargs and cls._is_plain_update(kwargs):
+                    instance = cls._update_without_instance(pk, kwargs)
+                else:
+                    instance = cls.Meta.model.objects.get(id=pk)
+                    if kwargs:
+                        cls._update_instance(instance, kwargs)
 
             # Save M2M fields on the instance
             for field, action_item in m2m_inputs.items():
@@ -214,6 +223,329 @@ class BaseType:
 
             return instance
 
+    @classmethod
+    def get_touch_fields(cls):
+        """Fields set to now by every update, `Meta.touch_fields` (see core.models.TimestampModel) and auto_now fields."""
+        auto_now = [field.name for field in cls.Meta.model._meta.concrete_fields if getattr(field, 'auto_now', False)]
+        return list(dict.fromkeys([*getattr(cls.Meta, 'touch_fields', []), *auto_now]))
+
+    @classmethod
+    def _touch(cls, instance):
+        now = timezone.now()
+        touch_fields = cls.get_touch_fields()
+        for field_name in touch_fields:
+            setattr(instance, field_name, now)
+        return touch_fields
+
+    @classmethod
+    def _has_save_hooks(cls):
+        """Whether saving the model runs code that needs the whole instance (custom save, signal receivers)."""
+        Model = cls.Meta.model
+        return (
+            Model.save is not DjangoModel.save
+            or signals.pre_save.has_listeners(Model)
+            or signals.post_save.has_listeners(Model)
+        )
+
+    @classmethod
+    def _file_fields(cls):
+        """Names of the model's file fields, their pre_save stores uploads."""
+        return {field.name for field in cls.Meta.model._meta.concrete_fields if isinstance(field, FileField)}
+
+    @classmethod
+    def _is_plain_update(cls, kwargs):
+        """Whether the update can be a single UPDATE statement without loading the instance first."""
+        fields = {field.name for field in cls.Meta.model._meta.concrete_fields}
+        return (
+            not cls._has_save_hooks()
+            and all(key in fields and key not in cls._file_fields() for key in kwargs)  # files are stored by pre_save
+        )
+
+    @classmethod
+    def _update_without_instance(cls, pk, kwargs):
+        """UPDATE the given columns WHERE id=pk and any of them differs, return the updated instance."""
+        Model = cls.Meta.model
+
+        # validate the given values in memory, foreign keys are model instances fetched already
+        updated = Model(id=pk, **kwargs)
+        related = [name for name, value in kwargs.items() if isinstance(value, DjangoModel)]
+        updated.clean_fields(exclude=[f.name for f in Model._meta.fields if f.name not in kwargs or f.name in related])
+
+        values = {**kwargs, **{name: timezone.now() for name in cls.get_touch_fields()}}
+        Model.objects.filter(id=pk).exclude(**kwargs).update(**values)  # unchanged values don't touch the row
+
+        return Model.objects.get(id=pk)  # raises DoesNotExist for a missing pk
+
+    @classmethod
+    def _update_instance(cls, instance, kwargs):
+        """Set the given values, validate and save only the fields that changed."""
+        Model = cls.Meta.model
+        fields = {field.name: field for field in Model._meta.concrete_fields}
+
+        if not all(key in fields for key in kwargs):
+            # properties or attnames, which can change any column
+            for key, val in kwargs.items():
+                setattr(instance, key, val)
+            instance.clean_fields()
+            instance.save()
+            return
+
+        changed = []
+        for key, val in kwargs.items():
+            field = fields[key]
+            current = getattr(instance, field.attname)
+            new = val.pk if field.is_relation and isinstance(val, DjangoModel) else val
+            if current != new or isinstance(field, FileField):
+                setattr(instance, key, val)
+                changed.append(key)
+
+        if not changed:
+            return
+
+        instance.clean_fields(exclude=[name for name in fields if name not in changed])
+        instance.save(update_fields=changed + cls._touch(instance))
+
+    @classmethod
+    def bulk_save(cls, items, batch_size=None):
+        """
+        Create (items without an id) or update many objects in a single transaction.
+
+        Items are validated in memory, foreign keys and M2M ids are fetched with one query per related
+        model, existing objects with one query and unique values with one query per unique field set.
+        Objects are written with bulk_create/bulk_update in batches of `batch_size` (GRAPHQL_BULK_BATCH_SIZE),
+        one by one with save() for models with save hooks, for uploaded files and for creates on databases
+        which can't return the pks of bulk inserts (sqlite with Django 3.2). M2M id lists are applied with
+        `_apply_through_action` once per distinct id list. Nested M2M data, reverse foreign keys and
+        custom through models fall back to `_apply_m2m_action` per object.
+
+        Nothing is written if any item is invalid. Return the saved instances (in the order of `items`)
+        and a list of errors {'index', 'field', 'messages'}.
+        """
+        Model = cls.Meta.model
+        batch_size = batch_size or settings.GRAPHQL_BULK_BATCH_SIZE
+        errors = []
+
+        def _error(index, field, messages):
+            errors.append({'index': index, 'field': field, 'messages': list(messages)})
+
+        items = [cls._split_bulk_item(item) for item in items]  # [(fields, fk ids, m2m inputs)]
+        related = cls._fetch_bulk_related(items, _error)
+        existing = cls._fetch_bulk_existing(items, _error)
+
+        instances, updated_fields = [], []
+        for i, (fields, fk_ids, m2m_inputs) in enumerate(items):
+            pk = fields.pop('id', None)
+            instance = existing.get(i) if pk else Model()
+            instances.append(instance)
+            updated_fields.append(set(fields) | set(fk_ids))
+            if instance is None:
+                continue  # not found
+
+            for field_name, value in fields.items():
+                setattr(instance, field_name, value)
+            for field_name, related_pk in fk_ids.items():
+                RelatedModel = getattr(Model, field_name).field.related_model
+                setattr(instance, field_name, None if related_pk is None else related[RelatedModel].get(str(related_pk)))
+
+            # resolved foreign keys exist already, clean_fields would check each with a query
+            exclude = {field_name for field_name, related_pk in fk_ids.items() if related_pk is not None}
+            if pk:
+                exclude |= {f.name for f in Model._meta.fields if f.name not in updated_fields[i]}
+            else:
+                exclude.add('id')
+
+            try:
+                instance.clean_fields(exclude=exclude)
+                instance.clean()
+            except ValidationError as e:
+                for field, messages in e.message_dict.items():
+                    _error(i, None if field == '__all__' else field, messages)
+
+        cls._validate_bulk_unique(instances, updated_fields, _error)
+
+        if errors:
+            return [None] * len(items), errors
+
+        with transaction.atomic():
+            cls._bulk_write(instances, items, updated_fields, batch_size)
+            cls._bulk_write_m2m(instances, items)
+
+        return instances, errors
+
+    @classmethod
+    def _validate_bulk_unique(cls, instances, updated_fields, error):
+        """Report unique values taken by other rows or by an earlier item, one query per unique field set."""
+        Model = cls.Meta.model
+        unique_checks, _ = Model()._get_unique_checks()
+
+        for model_class, unique_check in unique_checks:
+            if unique_check == (Model._meta.pk.name,):
+                continue
+
+            fields = [Model._meta.get_field(name) for name in unique_check]
+            attnames = [field.attname for field in fields]
+
+            def _key(values):  # citext columns compare case-insensitively
+                return tuple(v.casefold() if isinstance(f, CIText) and isinstance(v, str) else v for f, v in zip(fields, values))
+
+            values = {}  # {key: (values, [item index])}
+            for i, instance in enumerate(instances):
+                if instance is None or (instance.pk is not None and not set(unique_check) & updated_fields[i]):
+                    continue
+                item_values = tuple(getattr(instance, attname) for attname in attnames)
+                if None not in item_values:  # NULLs never collide
+                    values.setdefault(_key(item_values), (item_values, []))[1].append(i)
+
+            if not values:
+                continue
+
+            lookup = reduce(or_, (Q(**dict(zip(attnames, item_values))) for item_values, _ in values.values()))
+            taken = {_key(row[1:]): row[0] for row in model_class._default_manager.filter(lookup).values_list('pk', *attnames)}
+
+            for key, (item_values, indexes) in values.items():
+                for n, i in enumerate(indexes):
+                    if n > 0 or taken.get(key, instances[i].pk) != instances[i].pk:
+                        message = instances[i].unique_error_message(model_class, unique_check)
+                        error(i, unique_check[0] if len(unique_check) == 1 else None, message.messages)
+
+    @classmethod
+    def _split_bulk_item(cls, item):
+        fields, fk_ids, m2m_inputs = {}, {}, {}
+
+        for key, value in item.items():
+            field_name = cls.alias_to_attribute(key)
+            field_type = type(getattr(cls.Meta.model, field_name, None))
+
+            if field_type in (ManyToManyDescriptor, ReverseManyToOneDescriptor):
+                m2m_inputs[field_name] = value
+            elif field_type in (ForwardManyToOneDescriptor, ForwardOneToOneDescriptor) and not isinstance(value, DjangoModel):
+                fk_ids[field_name] = value
+            else:
+                fields[field_name] = value
+
+        return fields, fk_ids, m2m_inputs
+
+    @classmethod
+    def _m2m_related_model(cls, field_name):
+        descriptor = getattr(cls.Meta.model, field_name)
+        if type(descriptor) == ManyToManyDescriptor:
+            return descriptor.field.model if descriptor.reverse else descriptor.field.related_model
+        return descriptor.rel.related_model
+
+    @classmethod
+    def _m2m_through(cls, field_name, auto_created=True):
+        """(Through model, source attname, target attname) of an M2M field, None for other fields and custom through models unless `auto_created` is False."""
+        descriptor = getattr(cls.Meta.model, field_name)
+        if type(descriptor) != ManyToManyDescriptor or (auto_created and not descriptor.through._meta.auto_created):
+            return None
+
+        source, target = descriptor.field.m2m_field_name(), descriptor.field.m2m_reverse_field_name()
+        if descriptor.reverse:
+            source, target = target, source
+        return descriptor.through, f'{source}_id', f'{target}_id'
+
+    @classmethod
+    def _fetch_bulk_related(cls, items, error):
+        """Fetch the related objects of all FK and M2M ids, one query per related model. {RelatedModel: {str(pk): object}}"""
+        wanted = defaultdict(dict)  # {RelatedModel: {str(pk): [(item index, field name)]}}
+
+        for i, (fields, fk_ids, m2m_inputs) in enumerate(items):
+            for field_name, pk in fk_ids.items():
+                if pk is not None:
+                    RelatedModel = getattr(cls.Meta.model, field_name).field.related_model
+                    wanted[RelatedModel].setdefault(str(pk), []).append((i, field_name))
+            for field_name, action_item in m2m_inputs.items():
+                if action_item.get('action') not in ('clean', 'add', 'remove', 'set'):
+                    error(i, field_name, [f"Unknown action: {action_item.get('action')}"])
+                for pk in action_item.get('ids') or []:
+                    wanted[cls._m2m_related_model(field_name)].setdefault(str(pk), []).append((i, field_name))
+
+        related = {}
+        for RelatedModel, references in wanted.items():
+            pks = cls._valid_pks(RelatedModel, references)
+            related[RelatedModel] = {str(pk): obj for pk, obj in RelatedModel.objects.in_bulk(pks).items()}
+
+            for pk, pk_references in references.items():
+                if pk not in related[RelatedModel]:
+                    for i, field_name in pk_references:
+                        error(i, field_name, [f"{RelatedModel.__name__} matching id {pk} does not exist."])
+
+        return related
+
+    @classmethod
+    def _fetch_bulk_existing(cls, items, error):
+        """Fetch the objects of all update items with one query. {item index: instance}"""
+        Model = cls.Meta.model
+        references = defaultdict(list)
+        for i, (fields, fk_ids, m2m_inputs) in enumerate(items):
+            if fields.get('id'):
+                references[str(fields['id'])].append((i, 'id'))
+
+        objects = {str(pk): obj for pk, obj in Model.objects.in_bulk(cls._valid_pks(Model, references)).items()}
+
+        existing = {}
+        for pk, pk_references in references.items():
+            for i, field_name in pk_references:
+                if pk in objects:
+                    existing[i] = objects[pk]
+                else:
+                    error(i, field_name, [f"{Model.__name__} matching id {pk} does not exist."])
+        return existing
+
+    @classmethod
+    def _valid_pks(cls, Model, pks):
+        """Primary key values of the pks, malformed ones are left out (and reported as not found)."""
+        valid = []
+        for pk in pks:
+            try:
+                valid.append(Model._meta.pk.to_python(pk))
+            except ValidationError:
+                pass
+        return valid
+
+    @classmethod
+    def _bulk_write(cls, instances, items, updated_fields, batch_size):
+        Model = cls.Meta.model
+        connection = connections[router.db_for_write(Model)]
+        creates, updates = [], defaultdict(list)
+
+        # bulk writes skip Model.save (and its signals) and pre_save, which stores uploaded files
+        save_hooks = cls._has_save_hooks()
+        file_fields = cls._file_fields()
+
+        for instance, (fields, fk_ids, m2m_inputs), field_names in zip(instances, items, updated_fields):
+            one_by_one = save_hooks or field_names & file_fields
+            if instance.pk is not None:
+                if field_names and one_by_one:
+                    instance.save(update_fields=[*field_names, *cls._touch(instance)])
+                elif field_names:
+                    updates[frozenset(field_names)].append(instance)
+            elif one_by_one or not connection.features.can_return_rows_from_bulk_insert:
+                instance.save(force_insert=True)  # the pk is needed for the payload and the M2M rows
+            else:
+                creates.append(instance)
+
+        Model.objects.bulk_create(creates, batch_size=batch_size)
+        touch_fields = set(cls.get_touch_fields())
+        for field_names, objects in updates.items():
+            for instance in objects:
+                cls._touch(instance)
+            Model.objects.bulk_update(objects, field_names | touch_fields, batch_size=batch_size)
+
+    @classmethod
+    def _bulk_write_m2m(cls, instances, items):
+        grouped = defaultdict(list)  # {(field name, action, ids): [instance pk]}, imports often share the ids
+
+        for instance, (fields, fk_ids, m2m_inputs) in zip(instances, items):
+            for field_name, action_item in m2m_inputs.items():
+                if cls._m2m_through(field_name) is None or action_item.get('data'):
+                    cls._apply_m2m_action(instance, field_name, **action_item)
+                    continue
+                grouped[field_name, action_item['action'], tuple(action_item.get('ids') or ())].append(instance.pk)
+
+        for (field_name, action, ids), pks in grouped.items():
+            cls._apply_through_action(cls._m2m_through(field_name), pks, ids, action)
+
     @classmethod
     def clear(cls, instance, field):
         manager = getattr(instance, field)
@@ -241,45 +573,109 @@ class BaseType:
             raise AttributeError(f'Unknown action: {action}')
 
         manager = getattr(instance, field)
+        through = cls._m2m_through(field, auto_created=False)
 
         if action == 'clean':
             cls.clear(instance, field)
             return instance
-        if action == 'set':
+        if action == 'set' and not through:
             cls.clear(instance, field)
 
         InputModel = manager.model
 
         # GET equivalent
         if ids:
+            if through:
+                target_ids = InputModel.objects.filter(id__in=ids).values_list('id', flat=True)
+                cls._apply_through_action(through, [instance.pk], target_ids, action)
+                cls._forget_prefetched(instance, manager)
+                return instance
+
             input_qs = InputModel.objects.filter(id__in=ids)
             if action in ('add', 'set'):
                 manager.add(*input_qs)
-                return instance._meta.model.objects.get(id=instance.id)
             if action == 'remove':
                 manager.remove(*input_qs)
-                return instance
             return instance
 
         # CREATE/UPDATE equivalent
         else:
-            # TODO bulk create
-            for kwargs in data:
-                NestedField = cls.get_nested_field(field)
-                NestedType = NestedField.Type
-                if NestedField.reverse_key:
+            NestedField = cls.get_nested_field(field) if data else None
+            if NestedField and NestedField.reverse_key:
+                for kwargs in data:
                     kwargs[NestedField.reverse_key] = instance
 
-                child = NestedType.save(**kwargs)
+            NestedType = NestedField.Type if NestedField else None
+            if NestedType and (NestedType._has_save_hooks() or NestedType._file_fields()):
+                children, errors = [NestedType.save(**kwargs) for kwargs in data], []  # Model.save and file storage have to run
+            else:
+                children, errors = NestedType.bulk_save(data) if NestedType else ([], [])
+            if errors:
+                raise ValidationError({
+                    f"{field}.{error['index']}" + (f".{error['field']}" if error['field'] else ''): error['messages']
+                    for error in errors
+                })
+
+            if through:
+                cls._apply_through_action(through, [instance.pk], [child.pk for child in children], action)
+                cls._forget_prefetched(instance, manager)
+                return instance
 
-                if action in ('add', 'set'):
-                    manager.add(child)
-                    continue
-                if action == 'remove':
-                    manager.remove(child)
-                    continue
+            if not children:
+                return instance
+            if action in ('add', 'set') and not NestedField.reverse_key:  # the reverse key is saved with the children already
+                manager.add(*children)
+            if action == 'remove':
+                manager.remove(*children)
             return instance
 
+    @classmethod
+    def _forget_prefetched(cls, instance, manager):
+        """Drop the prefetched objects of an M2M field changed behind its manager's back."""
+        getattr(instance, '_prefetched_objects_cache', {}).pop(manager.prefetch_cache_name, None)
+
+    @classmethod
+    def _apply_through_action(cls, through, source_ids, target_ids, action):
+        """
+        Apply an M2M action to the through rows of all `source_ids` with set-based statements.
+
+        Only the rows of removed pairs are deleted (`set` keeps the pairs that stay) and only missing
+        pairs are inserted, GRAPHQL_BULK_BATCH_SIZE pairs at a time, so memory stays bounded for any
+        number of pairs. `source_ids` can be a values_list queryset, it's used as a subquery and
+        iterated in chunks.
+        """
+        Through, source, target = through
+        batch_size = settings.GRAPHQL_BULK_BATCH_SIZE
+        to_target_pk = Through._meta.get_field(target).target_field.to_python
+        target_ids = [to_target_pk(pk) for pk in target_ids]
+        rows = Through.objects.filter(**{f'{source}__in': source_ids})
+
+        if action == 'clean':
+            rows.delete()
+            return
+        if action == 'remove':
+            rows.filter(**{f'{target}__in': target_ids}).delete()
+            return
+        if action == 'set':
+            rows.exclude(**{f'{target}__in': target_ids}).delete()
+
+        if not target_ids:
+            return
+
+        sources = source_ids.iterator(chunk_size=batch_size) if isinstance(source_ids, QuerySet) else source_ids
+        pairs = ((source_id, target_id) for source_id in sources for target_id in target_ids)
+
+        for chunk in chunks(pairs, batch_size):
+            existing = set(Through.objects.filter(**{
+                f'{source}__in': {source_id for source_id, target_id in chunk},
+                f'{target}__in': {target_id for source_id, target_id in chunk},
+            }).values_list(source, target))
+
+            Through.objects.bulk_create(
+                [Through(**{source: source_id, target: target_id}) for source_id, target_id in chunk if (source_id, target_id) not in existing],
+                ignore_conflicts=True  # pairs inserted concurrently
+            )
+
     @classmethod
     def bulk_apply_m2m_action(cls, qs, field, action, related_ids=None):
         """
@@ -291,12 +687,10 @@ class BaseType:
         :param action: what to do with the new objects: add, remove, set, clean
         :param related_ids: required for add/remove/set actions
         """
-        manager = getattr(cls.Meta.model, field)
-        Through = manager.through
-        ids = qs.values_list('id', flat=True)
+        through = cls._m2m_through(field, auto_created=False)
 
-        related_name = manager.rel.model.__name__.lower()
-        model_name = manager.rel.related_model.__name__.lower()
+        if through is None:
+            raise TypeError(f"Bulk m2m actions need a many to many field, found {field}.")
 
         if action not in ('clean set add remove'.split()):
             raise KeyError(f"The `action` of a bulk m2m operation has to be one of: clean, set, add, remove. Found '{action}'")
@@ -304,24 +698,7 @@ class BaseType:
         if action != 'clean' and not hasattr(related_ids, '__iter__'):
             raise TypeError(f"`related_ids` iterable is required when doing add/remove/set bulk m2m actions. Found {related_ids}")
 
-        if action in ('clean', 'set'):
-            Through.objects.filter(**{f"{model_name}_id__in": ids}).delete()
-
-        if action == 'clean':
-            return
-
-        if related_ids:
-
-            if action in ('add', 'set'):
-                throughs = []
-                for pk in ids:
-                    throughs += [Through(**{f"{model_name}_id": pk, f"{related_name}_id": related_id}) for related_id in related_ids]
-                Through.objects.bulk_create(throughs)
-
-            if action == 'remove':
-                Through.objects.filter(**{f"{model_name}_id__in": ids, f"{related_name}_id__in": related_ids}).delete()
-
-        return
+        cls._apply_through_action(through, qs.values_list('id', flat=True), related_ids or [], action)
 
     @classmethod
     def add_to_meta(cls, field, value):
@@ -4,6 +4,8 @@ from .meta import MetaBase
 from utils.core import rgetattr
 
 from cachalot.utils import get_query_cache_key
+from django.contrib.auth import authenticate
+from graphql_jwt.exceptions import JSONWebTokenError
 
 
 def is_root_info(info):
@@ -12,6 +14,30 @@ def is_root_info(info):
     return root_path == info_path
 
 
+def get_request_user(request):
+    """
+    Return the user of the request, resolving a JWT ahead of the graphql_jwt middleware.
+
+    The JWT user is set on the request, so JSONWebTokenMiddleware doesn't authenticate it again
+    for every resolver. The result is memoized on the request.
+    """
+    if hasattr(request, '_api_user'):
+        return request._api_user
+
+    user = getattr(request, 'user', None)
+
+    if user is None or not user.is_authenticated:
+        try:
+            jwt_user = authenticate(request=request)
+        except JSONWebTokenError:
+            jwt_user = None  # invalid tokens are reported by the graphql_jwt middleware during execution
+        if jwt_user is not None:
+            request.user = user = jwt_user
+
+    request._api_user = user
+    return user
+
+
 class Locked(Exception):
     message = "The object is locked from adding new nodes."
 
@@ -56,21 +82,14 @@ def query_cache_key(*args, **kwargs):
     """
     Prepend default cachalot key with a prefix hash.
 
-    The prefix hash is made from the tenant id and roles.
-    It is saved on MetaBase to be quickly available during the whole request.
+    The prefix is the cache scope of the request user (api.cache.cache_scope).
+    It is saved on MetaBase by the view to be quickly available during the whole request.
     """
 
     hash_string = get_query_cache_key(*args, **kwargs)
 
-    user, tenant, roles, as_superuser = context.get_context()
-
-    if not tenant or as_superuser:
-        return hash_string
-
     if not MetaBase().cache_key_prefix:
-        # Should only run a single time
-        prefix = f'{tenant.pk}_{str(",".join(roles))}'
-        MetaBase().cache_key_prefix = prefix
+        return hash_string
 
     hash_string = MetaBase().cache_key_prefix + hash_string
     hash_string = hashlib.sha256(bytes(hash_string, encoding='utf-8')).hexdigest()
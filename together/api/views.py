@@ -1,13 +1,38 @@
 
-import json
+import asyncio
 # import sentry_sdk
 
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, nullcontext
+
 from django.conf import settings
-from django.http import HttpResponse
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import classonlymethod
+from django.utils.http import parse_etags
 
-from .meta import TimeoutExit
+from .admission import Overloaded, admission_controller, admission_enabled
+from .backends import get_document_backend
+from .cost import query_cost
+from .cache import (
+    cache_scope, get_cached_data, plan_tables, query_etag, response_cache_key, set_cached_data, start_table_recorder,
+    stop_table_recorder, table_versions
+)
+from .db import request_queries
+from .encoders import get_encoder
+from .executors import RootFieldThreadExecutor
+from .meta import TimeoutExit, meta_base
+from .metering import record_usage
+from .metrics import metrics_allowed, observe_request, registry, start_request_metrics
+from .profiling import profiling_requested, start_profiler, stop_profiler
+from .ratelimit import RateLimit, rate_limit_enabled
+from .slowlog import log_if_slow, slow_log_enabled, start_statement_log
+from .streaming import stream_response, streaming_requested
+from .utils import get_request_user
 
-from graphene_django.views import GraphQLView as DefaultGraphQlView
+from graphene_django.views import GraphQLView as DefaultGraphQlView, HttpError
 
 
 SUCCESS = dict((
@@ -19,10 +44,26 @@ SUCCESS = dict((
 
 
 class GraphQLView(DefaultGraphQlView):
-    """Capture original non-gql errors in sentry before returning gql response."""
+    """
+    Capture original non-gql errors in sentry before returning gql response.
+
+    Accepts a single operation or a JSON array of operations (Apollo batch format). The operations of
+    a batch share the request scope, the authenticated user and the DB connection, meta, warnings and
+    success are kept per operation.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.executor is None and settings.GRAPHQL_PARALLEL_ROOT_FIELDS:
+            self.executor = RootFieldThreadExecutor()
+        if 'backend' not in kwargs:
+            self.backend = get_document_backend()
+        self._operations = []  # [(operation_name, query, variables)]
+        self._successes = []
 
-    def execute_graphql_request(self, *args, **kwargs):
-        result = super().execute_graphql_request(*args, **kwargs)
+    def execute_graphql_request(self, request, data, query, variables, operation_name, *args, **kwargs):
+        self._operations.append((operation_name, query, variables))
+        result = super().execute_graphql_request(request, data, query, variables, operation_name, *args, **kwargs)
         # if result.errors:
         #     self._sentry_capture(result.errors)
         return result
@@ -31,35 +72,328 @@ class GraphQLView(DefaultGraphQlView):
     #     for error in errors:
     #         sentry_sdk.capture_exception(getattr(error, 'original_error', error))
 
-    def _add_response_field(self, response, name, value):
+    _profiler = None
+
+    def parse_body(self, request):
+        if self.get_content_type(request) == 'application/json' and request.body.lstrip()[:1] == b'[':
+            self.batch = True  # the view is instantiated per request
+
+        data = super().parse_body(request)
+
+        if self.batch and len(data) > settings.GRAPHQL_BATCH_MAX_SIZE:
+            raise HttpError(HttpResponseBadRequest(f"Batches are limited to {settings.GRAPHQL_BATCH_MAX_SIZE} operations."))
+        return data
+
+    def get_response(self, request, data, show_graphiql=False):
+        if not self.batch:
+            return self._cached_response(request, data, show_graphiql)
+
+        get_request_user(request)  # authenticate once for the whole batch
+        meta_base.reset_operation()
+        if self._profiler:
+            self._profiler.reset()
+
+        try:
+            result, status_code = self._cached_response(request, data, show_graphiql)
+        except TimeoutExit:
+            # the following operations of the batch time out right away as well
+            status_code = 200
+            result = get_encoder()(self._timeout_payload({'id': data.get('id'), 'status': status_code}))
+
+        return (result.decode('utf-8') if isinstance(result, bytes) else result), status_code
+
+    _last_response = None
+
+    def _response_cache_key(self, request, data, show_graphiql):
+        """api.cache key of a cacheable query operation, None for everything else."""
+        if not settings.GRAPHQL_RESPONSE_CACHE or self._profiler or show_graphiql:
+            return None
+
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        if not query:
+            return None
+        try:
+            document = self.get_backend(request).document_from_string(self.schema, query)
+        except Exception:
+            return None  # reported by the regular execution
+        if document.get_operation_type(operation_name) != 'query':
+            return None
+
+        scope = cache_scope(get_request_user(request))
+        meta_base.cache_key_prefix = scope
+        return response_cache_key(query, variables, operation_name, scope)
+
+    def _cached_response(self, request, data, show_graphiql=False):
+        """get_response served from the response cache (api.cache) when possible."""
+        key = self._response_cache_key(request, data, show_graphiql)
+        if key is None:
+            return super().get_response(request, data, show_graphiql)
+
+        cached_data = get_cached_data(key)
+        if cached_data is not None:
+            query, variables, operation_name, id = self.get_graphql_params(request, data)
+            self._operations.append((operation_name, query, variables))
+            response = {'data': cached_data, **({'id': id, 'status': 200} if self.batch else {})}
+            return self.json_encode(request, response), 200
+
+        self._last_response = None
+        recorder = start_table_recorder()
         try:
-            data = json.loads(response.content)
-            data[name] = value
-            response.content = json.dumps(data)
-            return response
-        except json.decoder.JSONDecodeError:
-            return response
-
-    def _evaluate_success(self, response):
-        if 'errors' not in response:
+            result, status_code = super().get_response(request, data, show_graphiql)
+        finally:
+            stop_table_recorder(recorder)
+
+        response = self._last_response
+        if status_code == 200 and response and 'errors' not in response and not meta_base.get_warnings():
+            set_cached_data(key, response['data'], recorder)
+
+        return result, status_code
+
+    def _evaluate_success(self, payload):
+        if 'errors' not in payload:
             return SUCCESS['FULL']
-        if 'data' not in response:
+        data = payload.get('data')
+        if data is None:
             return SUCCESS['NONE']
+        if meta_base.get_timed_out_paths() and all(value is None for value in data.values()):
+            return SUCCESS['TIMEOUT']  # graceful timeout before any root field finished
+        return SUCCESS['PARTIAL']
+
+    def _request_success(self):
+        """Success of the whole request, batches are FULL or NONE only if all operations are."""
+        successes = set(self._successes)
+        if not successes:
+            return SUCCESS['FULL']  # GraphiQL pages aren't encoded
+        if len(successes) == 1:
+            return successes.pop()
+        if SUCCESS['TIMEOUT'] in successes:
+            return SUCCESS['TIMEOUT']
         return SUCCESS['PARTIAL']
 
+    def _request_operation(self):
+        """(operation name, query, variables) of the request, batches are reported as a single operation."""
+        if len(self._operations) == 1:
+            return self._operations[0]
+        if not self._operations:
+            return None, None, None
+        return (
+            'batch',
+            '\n'.join(query or '' for operation_name, query, variables in self._operations),
+            {str(i): variables for i, (operation_name, query, variables) in enumerate(self._operations)},
+        )
+
+    def _build_payload(self, response, success=None):
+        """Complete the graphene response dict with success, warnings and extensions."""
+        payload = dict(response)
+        payload['success'] = success or self._evaluate_success(payload)
+        self._successes.append(payload['success'])
+
+        warnings = meta_base.get_warnings()
+        if warnings:
+            payload['warnings'] = [warning.as_graphql_dict() for warning in warnings]
+
+        if self._profiler:
+            payload['extensions'] = {'performance': self._profiler.report()}
+
+        return payload
+
+    def json_encode(self, request, d, pretty=False):
+        """Called by graphene with the response dict, the payload is encoded exactly once."""
+        self._last_response = d
+        pretty = self.pretty or pretty or bool(request.GET.get('pretty'))
+        return get_encoder()(self._build_payload(d), pretty)
+
+    def _timeout_payload(self, response=None):
+        return self._build_payload({
+            **(response or {}),
+            'data': None,
+            'errors': [{'message': f"The request timed out (>{settings.GRAPHQL_TIMEOUT}ms)."}]
+        }, success=SUCCESS['TIMEOUT'])
+
     def _timeout_response(self):
-        return HttpResponse(content=json.dumps({
+        return HttpResponse(content=get_encoder()(self._timeout_payload()), content_type='application/json')
+
+    _cost = None
+
+    def _request_cost(self, request):
+        """Static cost (api.cost) of all operations of the request."""
+        if self._cost is None:
+            self._cost = self._compute_request_cost(request)
+        return self._cost
+
+    def _compute_request_cost(self, request):
+        try:
+            data = self.parse_body(request)
+            if not self.batch and self.graphiql and self.can_display_graphiql(request, data):
+                return 0
+            cost = 0
+            for operation_data in (data if self.batch else [data]):
+                query, variables, operation_name, id = self.get_graphql_params(request, operation_data)
+                if query:
+                    document = self.get_backend(request).document_from_string(self.schema, query)
+                    cost += query_cost(self.schema, document.document_ast, operation_name, variables)
+            return cost
+        except Exception:
+            return 1  # reported by the regular execution
+
+    def _rate_limited_response(self, retry_after):
+        payload = self._build_payload({
             'data': None,
-            'errors': [{'message': f"The request timed out (>{settings.GRAPHQL_TIMEOUT}ms)."}]}))
+            'errors': [{
+                'message': f"Rate limit exceeded, retry in {retry_after}s.",
+                'extensions': {'code': 'RATE_LIMITED', 'retryAfter': retry_after},
+            }]
+        }, success=SUCCESS['NONE'])
+        response = HttpResponse(content=get_encoder()(payload), status=429, content_type='application/json')
+        response['Retry-After'] = str(retry_after)
+        return response
 
-    def dispatch(self, *args, **kwargs):
+    def _overloaded_response(self, error):
+        payload = self._build_payload({
+            'data': None,
+            'errors': [{'message': str(error), 'extensions': {'code': 'OVERLOADED', 'costClass': error.cost_class}}]
+        }, success=SUCCESS['NONE'])
+        response = HttpResponse(content=get_encoder()(payload), status=503, content_type='application/json')
+        response['Retry-After'] = '1'
+        return response
+
+    def _admission(self, request):
+        if not admission_enabled():
+            return nullcontext()
+        return admission_controller.admit(self._request_cost(request))
+
+    streaming = True  # see api.streaming
+
+    def _stream_response(self, request, resources):
+        if not (self.streaming and streaming_requested(request) and request.method.lower() in ('get', 'post')):
+            return None
+        try:
+            data = self.parse_body(request)
+        except HttpError:
+            return None  # reported by the regular execution
+        if self.batch:
+            return None
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        if not query:
+            return None
+        self._operations.append((operation_name, query, variables))
+        return stream_response(request, self.schema, query, variables, resources)
 
+    def _etag(self, request):
+        """ETag of a GET query from its document, variables, user scope and the versions of the tables it reads."""
+        if not settings.GRAPHQL_ETAGS or request.method.lower() != 'get' or self._profiler:
+            return None
         try:
-            result = super(GraphQLView, self).dispatch(*args, **kwargs)
-            success = self._evaluate_success(result)
+            data = self.parse_body(request)
+            if self.batch or (self.graphiql and self.can_display_graphiql(request, data)):
+                return None
+            query, variables, operation_name, id = self.get_graphql_params(request, data)
+            document = self.get_backend(request).document_from_string(self.schema, query)
+        except Exception:
+            return None  # reported by the regular execution
+
+        tables = plan_tables(self.schema, document.document_ast, operation_name)
+        if tables is None:
+            return None
+
+        scope = cache_scope(get_request_user(request))
+        return query_etag(query, variables, operation_name, scope, table_versions(tables))
+
+    def dispatch(self, request, *args, **kwargs):
+
+        self._profiler = start_profiler() if profiling_requested(request) else None
+        request_metrics = start_request_metrics()
+        statement_log = start_statement_log() if slow_log_enabled() else None
+
+        etag = self._etag(request)
+        rate_limit = RateLimit(request, get_request_user(request)) if rate_limit_enabled() else None
+
+        try:
+            if etag and etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+                result = HttpResponseNotModified()
+            elif rate_limit and not rate_limit.admit(lambda: self._request_cost(request)):
+                result = self._rate_limited_response(rate_limit.retry_after)
+            else:
+                with ExitStack() as resources:
+                    resources.enter_context(self._admission(request))
+                    result = self._stream_response(request, resources)  # takes over the admission slot
+                    if result is None:
+                        with request_queries():
+                            result = super(GraphQLView, self).dispatch(request, *args, **kwargs)
         except TimeoutExit:
             result = self._timeout_response()
-            success = SUCCESS['TIMEOUT']
+        except Overloaded as e:
+            result = self._overloaded_response(e)
+
+        if rate_limit:
+            rate_limit.finish()
+        success = self._request_success()
+
+        if etag and result.status_code in (200, 304) and success == SUCCESS['FULL']:
+            result['ETag'] = etag
+            patch_vary_headers(result, ('Authorization', 'Cookie'))
+        operation_name, query, variables = self._request_operation()
+
+        if self._profiler:
+            stop_profiler()
+
+        record_usage(request)
+        observe_request(operation_name, success, request_metrics)
+        if statement_log:
+            log_if_slow(request, query, variables, operation_name, success, statement_log)
 
-        result = self._add_response_field(result, 'success', success)
         return result
+
+
+def metrics_view(request):
+    """Prometheus text exposition of api.metrics, see GRAPHQL_METRICS."""
+    if not settings.GRAPHQL_METRICS:
+        raise Http404()
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+_async_executor = None
+
+
+def get_async_executor():
+    """Return the thread pool shared by all AsyncGraphQLView requests of this process."""
+    global _async_executor
+    if _async_executor is None:
+        _async_executor = ThreadPoolExecutor(
+            max_workers=settings.GRAPHQL_ASYNC_POOL_SIZE,
+            thread_name_prefix='graphql'
+        )
+    return _async_executor
+
+
+class AsyncGraphQLView(GraphQLView):
+    """
+    GraphQLView for the ASGI application.
+
+    Django runs sync views under ASGI one at a time on a single thread. This view is a coroutine
+    and runs the (synchronous) ORM work in a bounded pool of GRAPHQL_ASYNC_POOL_SIZE threads
+    instead, so the event loop keeps accepting requests. Timeouts, meta and warnings work the
+    same as in GraphQLView, the request scope is carried into the pool thread with the context.
+    """
+
+    streaming = False  # Django iterates streamed content on the event loop, where the ORM can't run
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view._is_coroutine = asyncio.coroutines._is_coroutine  # tells Django the view is async
+        return view
+
+    async def dispatch(self, *args, **kwargs):
+        dispatch = sync_to_async(self._pooled_dispatch, thread_sensitive=False, executor=get_async_executor())
+        return await dispatch(*args, **kwargs)
+
+    def _pooled_dispatch(self, *args, **kwargs):
+        # request_started/finished close connections on Django's own sync thread, not on the pool threads
+        close_old_connections()
+        try:
+            return super().dispatch(*args, **kwargs)
+        finally:
+            close_old_connections()
@@ -3,6 +3,7 @@ from api.registry import get_global_registry
 
 # Import schema files from newly registered apps
 # Sorted from core apps to more dependent apps, NOT ALPHABETICALLY
+from core.schema import *
 from users.schema import *
 from locations.schema import *
 from organisations.schema import *
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 
 # import boto3
 import os
+import tempfile
 
 from pathlib import Path
 
@@ -49,6 +50,7 @@ INSTALLED_APPS = [
     # Third party apps
     'django_extensions',
     'graphene_django',
+    'versatileimagefield',
     # Local apps
     'api',
     'events',
@@ -112,6 +114,23 @@ STATIC_ROOT = os.path.join(BASE_DIR, "..", "static/")
 MEDIA_ROOT = os.path.join(BASE_DIR, "..", "media/")
 
 
+# Renditions, see core.renditions
+VERSATILEIMAGEFIELD_RENDITION_KEY_SETS = {  # key: "sizer__size", Image.rendition(key) and ImageType.renditions
+    'default': [
+        ('large', 'thumbnail__1200x1200'),
+        ('medium', 'thumbnail__600x600'),
+        ('crop', 'crop__400x400'),
+        ('small', 'crop__100x100'),
+    ],
+}
+RENDITION_WORKER_PROCESSES = 2  # processes of ./manage.py warm_renditions
+RENDITION_TASK_LEASE = 300  # seconds a worker holds a task before another one may take it over
+RENDITION_MAX_ATTEMPTS = 5  # tries of a task before it's left failed in the queue
+RENDITION_RETRY_DELAY = 30  # seconds before the first retry, doubled with every attempt
+RENDITION_POLL_INTERVAL = 2  # seconds an idle worker sleeps between looking for tasks
+RENDITION_CLAIM_CANDIDATES = 10  # due tasks a worker tries to lease at a time
+
+
 # Graphene
 GRAPHENE = {
     'SCHEMA': 'config.schema.schema',
@@ -119,11 +138,68 @@ GRAPHENE = {
         'api.middleware.MetaFieldResolverMiddleware',
         'api.middleware.TimeoutMiddleware',
         "graphql_jwt.middleware.JSONWebTokenMiddleware",
+        'api.middleware.MetricsMiddleware',
+        'api.middleware.ProfilingMiddleware',
     ]
 }
 GRAPHENE_MUTATIONS = []
 GRAPHENE_NODE_DICT = {}
 GRAPHQL_TIMEOUT = 1000
+GRAPHQL_TIMEOUT_PARTIAL = False  # on timeout return the data resolved so far, null unfinished fields with per-path errors
+GRAPHQL_STATEMENT_TIMEOUT_SLACK = 50  # ms the db statement_timeout may lag behind the request deadline
+GRAPHQL_ASYNC = os.getenv('GRAPHQL_ASYNC', 'false') == 'true'  # set by config.asgi
+GRAPHQL_ASYNC_POOL_SIZE = int(os.getenv('GRAPHQL_ASYNC_POOL_SIZE', 16))  # threads (and db connections) per ASGI process
+GRAPHQL_PARALLEL_ROOT_FIELDS = False  # resolve root model fields of a query in parallel, see api.executors
+GRAPHQL_ROOT_FIELD_POOL_SIZE = 8  # threads (and db connections) per process for parallel root fields
+GRAPHQL_PROFILING_HEADER = 'HTTP_X_GRAPHQL_PERFORMANCE'  # staff users get `extensions.performance` when sent
+GRAPHQL_N_PLUS_ONE_THRESHOLD = 5  # same SQL shape repeated more often is reported as N+1
+GRAPHQL_USAGE_FLUSH_RECORDS = 500  # buffered api.Usage rows that trigger a write
+GRAPHQL_USAGE_FLUSH_INTERVAL = 60  # seconds after which buffered api.Usage rows are written
+GRAPHQL_METRICS = os.getenv('GRAPHQL_METRICS', 'false') == 'true'  # serve /metrics to staff users and the GRAPHQL_METRICS_TOKEN bearer, see api.metrics
+GRAPHQL_METRICS_TOKEN = os.getenv('GRAPHQL_METRICS_TOKEN')  # `Authorization: Bearer <token>` of the Prometheus scraper, None for staff users only
+GRAPHQL_METRICS_DIR = os.getenv('GRAPHQL_METRICS_DIR')  # shared directory of multiprocess metrics, None for a single process
+GRAPHQL_METRICS_DUMP_INTERVAL = 5  # seconds between dumps of a process' metrics into GRAPHQL_METRICS_DIR
+GRAPHQL_METRICS_MAX_OPERATIONS = 200  # distinct operation name labels, more are reported as `other`
+GRAPHQL_SLOW_LOG_THRESHOLD = int(os.environ['GRAPHQL_SLOW_LOG_THRESHOLD']) if os.getenv('GRAPHQL_SLOW_LOG_THRESHOLD') else None  # ms after which a request is written to the slow log, None disables it
+GRAPHQL_SLOW_LOG_PATH = os.getenv('GRAPHQL_SLOW_LOG_PATH', os.path.join(tempfile.gettempdir(), 'together', 'graphql_slow.log'))  # each process writes to PATH.<pid>
+GRAPHQL_SLOW_LOG_MAX_BYTES = 10 * 1024 * 1024  # size at which the slow log is rotated
+GRAPHQL_SLOW_LOG_BACKUP_COUNT = 5  # rotated slow log files kept
+GRAPHQL_SLOW_LOG_MAX_STATEMENTS = 50  # SQL statements recorded per slow request
+GRAPHQL_JSON_ENCODER = 'api.encoders.encode_json'  # response encoder, uses orjson when installed
+GRAPHQL_STREAM_HEADER = 'HTTP_X_GRAPHQL_STREAM'  # requests streaming of a large list query, see api.streaming
+GRAPHQL_STREAM_CHUNK_SIZE = 2000  # rows fetched from the db cursor and encoded at once when streaming
+GRAPHQL_BATCH_MAX_SIZE = 20  # operations accepted in a single batched request
+GRAPHQL_DOCUMENT_CACHE_SIZE = 500  # parsed GraphQL documents kept per process
+GRAPHQL_RESPONSE_CACHE = os.getenv('GRAPHQL_RESPONSE_CACHE', 'false') == 'true'  # needs a cache shared by all processes, see api.cache
+GRAPHQL_RESPONSE_CACHE_ALIAS = 'default'  # CACHES entry of the response cache and table versions
+GRAPHQL_RESPONSE_CACHE_TIMEOUT = 300  # seconds a cached response is kept
+GRAPHQL_RATE_LIMIT = os.getenv('GRAPHQL_RATE_LIMIT')  # 'static' (query cost) or 'sql_time' (ms of SQL), None disables it, see api.ratelimit
+GRAPHQL_RATE_LIMIT_TIERS = {  # token bucket per client: capacity and refill rate per second, None is unlimited
+    'anonymous': {'capacity': 200, 'rate': 2},
+    'user': {'capacity': 2000, 'rate': 20},
+    'staff': None,
+}
+GRAPHQL_RATE_LIMIT_CACHE_ALIAS = 'default'  # CACHES entry of the token buckets, shared by all processes or local to each
+GRAPHQL_RATE_LIMIT_IP_HEADER = 'REMOTE_ADDR'  # META key of the client address of anonymous requests, e.g. HTTP_X_FORWARDED_FOR
+GRAPHQL_COST_LIST_SIZE = 50  # expected size of list fields without pagination, see api.cost
+GRAPHQL_COST_MAX_LIST_SIZE = 10000  # highest limitTo charged, keeps the cost of absurd limits a number
+GRAPHQL_COST_MUTATION = 10  # base cost of a mutation operation
+GRAPHQL_ADMISSION = os.getenv('GRAPHQL_ADMISSION', 'false') == 'true'  # limit concurrent executions per process, see api.admission
+GRAPHQL_ADMISSION_CLASSES = {  # cost classes by highest static cost (None for any) and their in-flight executions per process
+    'light': {'max_cost': 100, 'limit': 16},
+    'heavy': {'max_cost': None, 'limit': 4},
+}
+GRAPHQL_ADMISSION_QUEUE_SIZE = 64  # requests waiting for admission per cost class, more are shed
+GRAPHQL_ADMISSION_MIN_BUDGET = 200  # ms of GRAPHQL_TIMEOUT a request needs left to be admitted
+GRAPHQL_BULK_MAX_ITEMS = 1000  # items accepted by a single BulkSave mutation
+GRAPHQL_BULK_BATCH_SIZE = 500  # rows per INSERT/UPDATE statement of bulk writes
+GRAPHQL_BULK_DELETE_CHUNK_SIZE = 1000  # objects deleted per transaction by a BulkDelete mutation
+GRAPHQL_IDEMPOTENCY_CACHE_ALIAS = 'default'  # CACHES entry of stored mutation payloads and their locks, shared by all processes, see api.idempotency
+GRAPHQL_IDEMPOTENCY_TTL = 24 * 60 * 60  # seconds a payload is returned to retries with the same key
+GRAPHQL_IDEMPOTENCY_LOCK_TIMEOUT = 30  # seconds a lock outlives a crashed execution
+GRAPHQL_IDEMPOTENCY_POLL_INTERVAL = 0.05  # seconds between checks of a concurrent duplicate for the stored payload
+GRAPHQL_IDEMPOTENCY_KEY_LENGTH = 255  # longest accepted key
+GRAPHQL_ETAGS = os.getenv('GRAPHQL_ETAGS', 'false') == 'true'  # ETag / 304 for GET queries, uses the table versions of api.cache
 
 
 # Password validation
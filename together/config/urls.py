@@ -8,15 +8,19 @@ from django.contrib import admin
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
 
-from api.views import GraphQLView
+from api.views import AsyncGraphQLView, GraphQLView, metrics_view
+
+
+GraphQL = AsyncGraphQLView if settings.GRAPHQL_ASYNC else GraphQLView
 
 
 urlpatterns = [
     # General
     url(r'^admin', admin.site.urls),
 
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True))),
-    path("graphql/", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path("graphql", csrf_exempt(GraphQL.as_view(graphiql=True))),
+    path("graphql/", csrf_exempt(GraphQL.as_view(graphiql=True))),
+    path("metrics", metrics_view),
 
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)  # + app_url_patterns
 
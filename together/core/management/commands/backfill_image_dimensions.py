@@ -0,0 +1,46 @@
+import multiprocessing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from core.models import Image
+from utils.core import chunks
+
+
+def backfill(image_ids):
+    """Store width, height and format of the images, returns the number of readable ones."""
+    images = list(Image.objects.filter(pk__in=image_ids))
+    for image in images:
+        image.update_image_info()
+    Image.objects.bulk_update(images, ('width', 'height', 'format'))
+    return sum(1 for image in images if image.width)
+
+
+class Command(BaseCommand):
+    """
+    Fill Image.width, height and format of images uploaded before they were stored.
+
+    Chunks of images are read by a pool of worker processes, every image file is opened once:
+
+        ./manage.py backfill_image_dimensions --processes 8
+    """
+
+    help = "Read the dimensions and format of images without them in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.RENDITION_WORKER_PROCESSES)
+        parser.add_argument('--chunk-size', type=int, default=100, help="Images read and updated per task.")
+
+    def handle(self, *args, **options):
+        image_ids = list(Image.objects.filter(width__isnull=True).exclude(image='').values_list('id', flat=True))
+        tasks = [tuple(chunk) for chunk in chunks(image_ids, options['chunk_size'])]
+
+        if options['processes'] <= 1:
+            done = sum(map(backfill, tasks))
+        else:
+            connections.close_all()  # forked workers must open connections of their own
+            with multiprocessing.get_context('fork').Pool(options['processes'], initializer=connections.close_all) as pool:
+                done = sum(pool.imap_unordered(backfill, tasks))
+
+        self.stdout.write(f"Stored the dimensions of {done} of {len(image_ids)} images.")
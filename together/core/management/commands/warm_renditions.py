@@ -0,0 +1,51 @@
+import multiprocessing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Q
+
+from core.models import Image, RenditionTask
+from core.renditions import work
+
+
+class Command(BaseCommand):
+    """
+    Worker pool creating the renditions of uploaded images (core.renditions).
+
+    Runs forever next to the web processes, or drains the queue and exits with --drain:
+
+        ./manage.py warm_renditions --processes 4
+        ./manage.py warm_renditions --enqueue-missing --drain
+    """
+
+    help = "Process the rendition queue in parallel worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.RENDITION_WORKER_PROCESSES)
+        parser.add_argument('--drain', action='store_true', help="Exit once the queue is empty.")
+        parser.add_argument('--enqueue-missing', action='store_true', help="Enqueue (again) all images without renditions or their manifest first.")
+
+    def handle(self, *args, **options):
+        if options['enqueue_missing']:
+            missing = Image.objects.filter(Q(warmed_at__isnull=True) | Q(renditions={})).exclude(image='')
+            self.stdout.write(f"Enqueued {RenditionTask.enqueue_many(missing)} images.")
+
+        if options['processes'] <= 1:
+            work(drain=options['drain'])
+            return
+
+        connections.close_all()  # forked workers must open connections of their own
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=self._work, args=(options['drain'],)) for _ in range(options['processes'])]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    @staticmethod
+    def _work(drain):
+        try:
+            work(drain=drain)
+        finally:
+            connections.close_all()
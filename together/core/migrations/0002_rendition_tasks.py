@@ -0,0 +1,45 @@
+# Generated by Django 3.2.9 on 2026-10-19 09:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def enqueue_existing_images(apps, schema_editor):
+    """The synchronous warming of Image.save never created renditions, the workers create them instead."""
+    Image = apps.get_model('core', 'Image')
+    RenditionTask = apps.get_model('core', 'RenditionTask')
+    image_ids = Image.objects.exclude(image='').values_list('id', flat=True)
+    RenditionTask.objects.bulk_create([RenditionTask(image_id=image_id) for image_id in image_ids], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='warmed_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When the renditions were created.', null=True),
+        ),
+        migrations.CreateModel(
+            name='RenditionTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rendition_key_set', models.CharField(default='default', max_length=64)),
+                ('enqueued_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('run_after', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('image', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rendition_task', to='core.image')),
+            ],
+            options={
+                'ordering': ('run_after',),
+            },
+        ),
+        migrations.RunPython(enqueue_existing_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.9 on 2026-10-19 09:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_image_dimensions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Rendition urls by key set and key, written by the warming.'),
+        ),
+    ]
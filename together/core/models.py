@@ -2,14 +2,14 @@
 
 from django.conf import settings
 from django.contrib.postgres.fields import CICharField
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.utils.safestring import mark_safe
 
 from graphene.types.datetime import DateTime
+from PIL import Image as PILImage
 
 from versatileimagefield.fields import VersatileImageField
-from versatileimagefield.image_warmer import VersatileImageFieldWarmer
 
 
 class TimestampModel(models.Model):
@@ -26,10 +26,12 @@ class TimestampModel(models.Model):
             ('created', DateTime),
             ('modified', DateTime),
         )
+        touch_fields = ('modified',)  # set to now by api updates, which only write the changed columns
 
 
 class DisplayableModelMixin:
     displayable_field = 'image'
+    dimension_fields = None  # (width, height) fields storing the size of the image, so it's not read from storage
 
     @property
     def thumbnail_small(self):
@@ -41,14 +43,13 @@ class DisplayableModelMixin:
 
     def thumbnail(self, max_width=200):
         image = getattr(self, self.displayable_field)
+        width, height = (getattr(self, field) for field in self.dimension_fields) if self.dimension_fields else (None, None)
 
-        try:
-            width, height = image.width, image.height
+        if width and height:
             ratio, width = width / height, min(width, max_width)
-            height = width / ratio
+            height = round(width / ratio)
             return mark_safe(f'<img id="preview" src={image.url} width="{width}" height={height} />')
-        except AttributeError:
-            return mark_safe(f'<img id="preview" src={image.url} width="{max_width}"/>')
+        return mark_safe(f'<img id="preview" src={image.url} width="{max_width}"/>')
 
 
 class Icon(models.Model, DisplayableModelMixin):
@@ -65,6 +66,14 @@ class Icon(models.Model, DisplayableModelMixin):
 class Image(models.Model, DisplayableModelMixin):
     name = CICharField(max_length=128, unique=True, help_text='Name for internal use.')
     image = VersatileImageField(upload_to='images', null=False, blank=False)
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    format = models.CharField(max_length=16, blank=True, editable=False, help_text='Pillow format name, i.e. "JPEG".')
+    warmed_at = models.DateTimeField(null=True, blank=True, editable=False, help_text='When the renditions were created.')
+    renditions = models.JSONField(default=dict, blank=True, editable=False, help_text='Rendition urls by key set and key, written by the warming.')
+
+    dimension_fields = 'width', 'height'
+    file_fields = 'width', 'height', 'format', 'warmed_at', 'renditions'  # derived from the file by save
 
     class Meta:
         ordering = 'name',
@@ -73,19 +82,35 @@ class Image(models.Model, DisplayableModelMixin):
         return self.name
 
     def save(self, *args, **kwargs):
+        if self.image and (self._state.adding or not self.image._committed):  # a new file needs new renditions
+            self.warmed_at = None
+            self.renditions = {}
+            self.update_image_info()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], *self.file_fields}
+
         super().save(*args, **kwargs)
-        if self.image:
-            try:
-                # Prepare the sized versions of the image
-                image_warmer = VersatileImageFieldWarmer(
-                    instance_or_queryset=self,
-                    rendition_key_set='default',
-                    image_attr='image',
-                    verbose=False  # False means no print from the versatileimagefield lib
-                )
-                image_warmer.warm()
-            except FileNotFoundError:
-                pass  # when running locally (or file gets deleted in S3, which "never happens")
+
+        if self.image and self.warmed_at is None:
+            # Prepare the sized versions of the image in the warm_renditions workers, once the file is saved
+            transaction.on_commit(lambda: RenditionTask.enqueue(self.pk))
+
+    def update_image_info(self):
+        """Read the dimensions and format from the image file, only the header is decoded."""
+        committed = self.image._committed
+        try:
+            self.image.open('rb')
+            self.image.seek(0)
+            with PILImage.open(self.image) as image:
+                self.width, self.height = image.size
+                self.format = image.format or ''
+        except (OSError, ValueError):  # missing file or not an image
+            self.width, self.height, self.format = None, None, ''
+        finally:
+            if committed:
+                self.image.close()
+            else:
+                self.image.seek(0)  # the upload is saved to storage from the start
 
     def rendition(self, key, rendition_set='default'):
         """
@@ -95,11 +120,83 @@ class Image(models.Model, DisplayableModelMixin):
         This method gets the key and size of a rendition from a specific set and returns
         an image object. Calling `image._rendition('crop')` with a rendition_set that includes
         ('crop', 'crop__400x400') is equivalent to calling `image.image.crop['400x400']`
+
+        Until the renditions are warmed the original image is returned, so they aren't created
+        on demand in the request.
         """
         if self.image:
+            if self.warmed_at is None:
+                return self.image
             rendition, size = dict(settings.VERSATILEIMAGEFIELD_RENDITION_KEY_SETS[rendition_set])[key].split('__')
             return getattr(self.image, rendition)[size]
 
+    def rendition_urls(self, rendition_set='default'):
+        """
+        Return {key: url} of the renditions in a set from the `renditions` manifest, without touching storage.
+
+        Until the manifest of the set is written every key points to the original image.
+        """
+        if not self.image:
+            return {}
+        if rendition_set in self.renditions:
+            return self.renditions[rendition_set]
+        keys = dict(getattr(settings, 'VERSATILEIMAGEFIELD_RENDITION_KEY_SETS', {}).get(rendition_set, ()))
+        return {key: self.image.url for key in keys}
+
+
+class RenditionTask(models.Model):
+    """
+    Queue of images waiting for their renditions, processed by `./manage.py warm_renditions` (core.renditions).
+
+    One task per image, enqueueing an image again resets its task. A worker leases the task with
+    `locked_until`, failed tasks are retried after `run_after` until RENDITION_MAX_ATTEMPTS.
+    """
+    image = models.OneToOneField(Image, on_delete=models.CASCADE, related_name='rendition_task')
+    rendition_key_set = models.CharField(max_length=64, default='default')
+    enqueued_at = models.DateTimeField(default=timezone.now)
+    run_after = models.DateTimeField(default=timezone.now, db_index=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = 'run_after',
+
+    def __str__(self):
+        return f'{self.image_id} ({self.rendition_key_set})'
+
+    @classmethod
+    def enqueue(cls, image_id, rendition_key_set='default'):
+        now = timezone.now()
+        cls.objects.update_or_create(image_id=image_id, defaults={
+            'rendition_key_set': rendition_key_set,
+            'enqueued_at': now,
+            'run_after': now,
+            'locked_until': None,
+            'attempts': 0,
+            'last_error': '',
+        })
+
+    @classmethod
+    def enqueue_many(cls, images, rendition_key_set='default'):
+        """Enqueue (again) the images of a queryset with a bulk UPDATE and INSERT, returns the number of images."""
+        now = timezone.now()
+        requeued = cls.objects.filter(image__in=images).update(
+            rendition_key_set=rendition_key_set,
+            enqueued_at=now,
+            run_after=now,
+            locked_until=None,
+            attempts=0,
+            last_error='',
+        )
+        image_ids = images.filter(rendition_task__isnull=True).values_list('id', flat=True)
+        created = cls.objects.bulk_create(
+            [cls(image_id=image_id, rendition_key_set=rendition_key_set, enqueued_at=now, run_after=now) for image_id in image_ids],
+            batch_size=1000,
+            ignore_conflicts=True,  # enqueued by an upload meanwhile
+        )
+        return requeued + len(created)
+
 
 class S3Object(models.Model):
 
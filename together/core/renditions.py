@@ -0,0 +1,111 @@
+import logging
+import time
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from versatileimagefield.utils import build_versatileimagefield_url_set, get_rendition_key_set
+
+from .models import Image, RenditionTask
+
+
+"""
+Rendition warming
+
+Purpose:
+    Create the sized versions of uploaded images off the request path. Image.save enqueues a
+    RenditionTask once the transaction commits, `./manage.py warm_renditions` runs worker processes
+    draining the queue.
+
+    Workers lease a task by a conditional UPDATE of `locked_until`, so any number of processes can
+    share the queue without row locks, and a task of a crashed worker is taken over once its lease
+    of RENDITION_TASK_LEASE seconds runs out. The lease counts as an attempt, so an image crashing its
+    workers is given up as well. Warming is idempotent (existing renditions are kept), a failed task
+    is retried with exponential backoff up to RENDITION_MAX_ATTEMPTS attempts.
+
+    A task only completes when the image wasn't enqueued again meanwhile, a new upload is never marked
+    by the warming of the previous file. Completing sets Image.warmed_at and writes the urls of the
+    renditions to the Image.renditions manifest, GraphQL resolves them from there (core.schema).
+"""
+
+logger = logging.getLogger('core.renditions')
+
+
+def due_tasks():
+    now = timezone.now()
+    return RenditionTask.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+        run_after__lte=now,
+        attempts__lt=settings.RENDITION_MAX_ATTEMPTS,
+    )
+
+
+def claim_task():
+    """Lease the next due task, None when there is none."""
+    for task in due_tasks()[:settings.RENDITION_CLAIM_CANDIDATES]:
+        lease = timezone.now() + timedelta(seconds=settings.RENDITION_TASK_LEASE)
+        claimed = RenditionTask.objects.filter(
+            pk=task.pk,
+            enqueued_at=task.enqueued_at,
+            locked_until=task.locked_until,
+        ).update(locked_until=lease, attempts=F('attempts') + 1)
+
+        if claimed:  # 0 when another worker was faster
+            task.locked_until = lease
+            task.attempts += 1
+            return task
+    return None
+
+
+def warm(task):
+    """Create the missing renditions of the task's image, returns their {key: url}."""
+    image = Image.objects.get(pk=task.image_id).image
+    image.create_on_demand = True
+    return build_versatileimagefield_url_set(image, get_rendition_key_set(task.rendition_key_set))
+
+
+def complete(task, urls):
+    with transaction.atomic():
+        if RenditionTask.objects.filter(pk=task.pk, enqueued_at=task.enqueued_at).delete()[0]:
+            image = Image.objects.select_for_update().get(pk=task.image_id)
+            image.renditions = {**image.renditions, task.rendition_key_set: urls}
+            image.warmed_at = timezone.now()
+            image.save(update_fields=('renditions', 'warmed_at'))
+
+
+def fail(task, error):
+    delay = settings.RENDITION_RETRY_DELAY * 2 ** (task.attempts - 1)  # the attempt was counted by claim_task
+    RenditionTask.objects.filter(pk=task.pk, enqueued_at=task.enqueued_at).update(
+        run_after=timezone.now() + timedelta(seconds=delay),
+        locked_until=None,
+        last_error=repr(error),
+    )
+
+
+def process_task():
+    """Warm the next due task, False when the queue is empty."""
+    task = claim_task()
+    if task is None:
+        return False
+
+    try:
+        urls = warm(task)
+    except Exception as e:
+        logger.exception('Warming renditions of image %s failed.', task.image_id)
+        fail(task, e)
+    else:
+        complete(task, urls)
+    return True
+
+
+def work(drain=False):
+    """Process tasks until the queue is empty when `drain`, forever otherwise."""
+    while True:
+        if not process_task():
+            if drain:
+                return
+            time.sleep(settings.RENDITION_POLL_INTERVAL)
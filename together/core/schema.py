@@ -0,0 +1,42 @@
+import graphene
+
+from api.filters import DjangoFilter, PaginationFilter, IDFilter
+from api.registry import register_type
+
+from .models import Image
+
+
+class RenditionType(graphene.ObjectType):
+    key = graphene.String()
+    url = graphene.String()
+
+
+@register_type('Image')
+class ImageType:
+    url = graphene.String()
+    renditions = graphene.List(
+        RenditionType,
+        rendition_set=graphene.String(default_value='default'),
+        description='Sized versions of the image, the original until they are created.',
+    )
+
+    class Meta:
+        model = Image
+        queryset = Image.objects.all()
+        fields = ('id name width height format'.split())
+        lookups = (
+            ('id', graphene.ID()),
+            ('name', graphene.String()),
+        )
+        filters = {
+            'django_filter': DjangoFilter,
+            'pagination': PaginationFilter,
+            'ids': IDFilter
+        }
+
+    def resolve_url(image, info):
+        return image.image.url if image.image else None
+
+    def resolve_renditions(image, info, rendition_set='default'):
+        # read from the manifest written by core.renditions, the storage is never asked
+        return [RenditionType(key=key, url=url) for key, url in image.rendition_urls(rendition_set).items()]
@@ -0,0 +1,141 @@
+import io
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image as PILImage
+
+from core.models import Image, RenditionTask
+from core.renditions import claim_task, complete, process_task, warm
+
+
+def image_file(name, size=(120, 80), format='JPEG'):
+    content = io.BytesIO()
+    PILImage.new('RGB', size).save(content, format)
+    return ContentFile(content.getvalue(), name=f'{name}.{format.lower()}')
+
+
+def upload(name, size=(120, 80), format='JPEG'):
+    return Image(name=name, image=image_file(name, size, format))
+
+
+class MediaTestCase(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.media_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.media_override.enable()
+
+    def tearDown(self):
+        self.media_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+
+class RenditionWarmingTest(MediaTestCase):
+
+    def test_upload_enqueues_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            image = upload('queued')
+            image.save()
+            self.assertFalse(RenditionTask.objects.filter(image=image).exists())
+
+        for callback in callbacks:
+            callback()
+        self.assertTrue(RenditionTask.objects.filter(image=image).exists())
+
+    def test_drain_one_task(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = upload('warmed')
+            image.save()
+
+        self.assertEqual(image.rendition('crop'), image.image)  # the original until warmed
+
+        self.assertTrue(process_task())
+        self.assertFalse(process_task())
+
+        image.refresh_from_db()
+        self.assertIsNotNone(image.warmed_at)
+        self.assertFalse(RenditionTask.objects.exists())
+        self.assertEqual(set(image.renditions['default']), {'large', 'medium', 'crop', 'small'})
+        self.assertIn('__sized__', image.rendition_urls()['crop'])
+        self.assertTrue(image.image.storage.exists(image.rendition('crop').name))
+
+    def test_failed_task_is_retried(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = Image(name='missing', image='images/missing.jpg')
+            image.save()
+
+        with self.assertLogs('core.renditions', 'ERROR'):
+            process_task()
+
+        task = RenditionTask.objects.get(image=image)
+        self.assertEqual(task.attempts, 1)
+        self.assertIsNone(task.locked_until)
+        self.assertGreater(task.run_after, task.enqueued_at)
+        self.assertFalse(process_task())  # backed off
+
+    def test_reenqueued_image_is_not_marked(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = upload('replaced')
+            image.save()
+
+        task = claim_task()
+        urls = warm(task)
+        RenditionTask.enqueue(image.pk)  # a new upload while warming
+        complete(task, urls)
+
+        image.refresh_from_db()
+        self.assertIsNone(image.warmed_at)
+        self.assertTrue(RenditionTask.objects.filter(image=image).exists())
+
+    def test_lease_counts_as_an_attempt(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            upload('crashing').save()
+
+        claim_task()
+        RenditionTask.objects.update(locked_until=timezone.now())  # the worker died, its lease ran out
+        task = claim_task()
+
+        self.assertEqual(task.attempts, 2)
+        self.assertEqual(RenditionTask.objects.get().attempts, 2)
+
+    def test_enqueue_many(self):
+        with self.captureOnCommitCallbacks(execute=False):  # no tasks from the uploads
+            queued, missing = upload('queued'), upload('missing')
+            queued.save()
+            missing.save()
+        RenditionTask.objects.create(image=queued, attempts=3, last_error='error')
+
+        with self.assertNumQueries(3):  # UPDATE, SELECT of the images without a task, INSERT
+            self.assertEqual(RenditionTask.enqueue_many(Image.objects.all()), 2)
+
+        self.assertEqual(sorted(RenditionTask.objects.values_list('image__name', 'attempts', 'last_error')), [
+            ('missing', 0, ''), ('queued', 0, ''),
+        ])
+
+
+class ImageInfoTest(MediaTestCase):
+
+    def test_upload_stores_dimensions(self):
+        image = upload('sized', size=(640, 480), format='PNG')
+        image.save()
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height, image.format), (640, 480, 'PNG'))
+        self.assertIn('height=225', image.thumbnail_large)
+
+    def test_partial_update_of_the_file_stores_derived_fields(self):
+        image = upload('replaced', size=(640, 480))
+        image.save()
+        Image.objects.filter(pk=image.pk).update(warmed_at=timezone.now(), renditions={'default': {}})
+
+        image.refresh_from_db()
+        image.image = image_file('replacement', size=(200, 100))
+        image.save(update_fields=['image'])
+
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height), (200, 100))
+        self.assertIsNone(image.warmed_at)
+        self.assertEqual(image.renditions, {})
+        self.assertTrue(image.image.storage.exists(image.image.name))
@@ -1,11 +1,14 @@
 
 import graphene
 
+from django.db.models import Prefetch
+
 from api.fields import NestedField, ModelListField, ReverseField
 from api.filters import DjangoFilter, PaginationFilter, IDFilter
 from api.registry import register_type
 
 from .models import Event
+from core.schema import ImageType
 from organisations.schema import OrganisationType
 from users.models import User
 
@@ -38,7 +41,11 @@ class EventType:
         queryset = Event.objects.all()
         fields = ('id created modified title description'.split())
         displayable_fields = 'image',
-        prefetch_related = 'members',
+        select_related = 'image',
+        prefetch_related = {
+            'members': 'members',
+            'gallery': Prefetch('gallery'),  # plain names equal to their field are skipped by api.factories
+        }
         lookups = (
             ('id', graphene.ID()),
             ('title', graphene.String()),
@@ -50,6 +57,8 @@ class EventType:
         }
         related_fields = {
             NestedField('organisation', OrganisationType),
+            NestedField('image', ImageType),
+            NestedField('gallery', ImageType),
             ReverseField(OrganisationType, 'events'),
         }
 
@@ -4,7 +4,7 @@ import inspect
 from functools import reduce
 from collections import Counter, OrderedDict
 from copy import copy
-from itertools import groupby
+from itertools import groupby, islice
 from typing import Any, Callable, Dict, Iterable, Sequence, Tuple
 
 
@@ -185,6 +185,16 @@ def debug_print_conditions(message='', **kwargs):
     print(message, *out)
 
 
+def chunks(iterable, size):
+    """Yield lists of `size` items of any iterable (the last one may be shorter), consuming it lazily."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
 def get_duplicates(iterable):
     return [item for item, count in Counter(iterable).items() if count > 1]
 
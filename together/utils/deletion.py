@@ -0,0 +1,177 @@
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import signals
+from django.db.models.deletion import (
+    CASCADE,
+    DO_NOTHING,
+    PROTECT,
+    RESTRICT,
+    SET_NULL,
+    Collector,
+    ProtectedError,
+    RestrictedError,
+    get_candidate_relations_to_delete,
+)
+
+from .django import model_to_str
+
+
+class CollectorRequired(Exception):
+    """The deletion can't be done with set-based deletes, Django's Collector has to load the objects."""
+
+
+def relation_tree(Model, path=()):
+    """
+    [(foreign key, action, subtree)] of the relations deleting Model rows affects, action is one of
+    'delete', 'set_null' or 'protect'.
+
+    Raises CollectorRequired for anything the raw deletes wouldn't do: delete signal receivers, generic
+    relations, inherited models, SET_DEFAULT / SET() and cascade cycles.
+    """
+    if Model in path:
+        raise CollectorRequired(f'{model_to_str(Model)} cascades into itself.')
+    if signals.pre_delete.has_listeners(Model) or signals.post_delete.has_listeners(Model):
+        raise CollectorRequired(f'{model_to_str(Model)} has delete signal receivers.')
+    if Model._meta.parents or Model._meta.private_fields:
+        raise CollectorRequired(f'{model_to_str(Model)} has parent models or generic relations.')
+
+    tree = []
+    for related in get_candidate_relations_to_delete(Model._meta):
+        on_delete = related.field.remote_field.on_delete
+
+        if on_delete == DO_NOTHING:
+            continue
+        if on_delete == CASCADE:
+            tree.append((related.field, 'delete', relation_tree(related.related_model, path + (Model,))))
+        elif on_delete == SET_NULL:
+            tree.append((related.field, 'set_null', []))
+        elif on_delete in (PROTECT, RESTRICT):
+            tree.append((related.field, 'protect', []))
+        else:
+            raise CollectorRequired(f'{model_to_str(related.related_model)}.{related.field.name} sets a value on delete.')
+    return tree
+
+
+def cascade_steps(tree, queryset):
+    """(foreign key, action, queryset) of every relation in the tree, rows depending on others come first."""
+    for field, action, subtree in tree:
+        related_queryset = field.model._base_manager.filter(**{f'{field.name}__in': queryset})
+        yield from cascade_steps(subtree, related_queryset)
+        yield field, action, related_queryset
+
+
+def _add_count(report, Model, action, count):
+    key = (model_to_str(Model), action)
+    report[key] = report.get(key, 0) + count
+
+
+def _report(report):
+    return [{'model': model, 'action': action, 'count': count} for (model, action), count in report.items()]
+
+
+def estimate_deletion(queryset):
+    """
+    Rows deleting the queryset would delete, nullify or be protected by, counted per model without
+    loading any object: [{'model': 'app.Model', 'action': 'delete' | 'set_null' | 'protect', 'count': n}].
+    """
+    Model = queryset.model
+    root = Model._base_manager.filter(pk__in=queryset.values('pk'))
+    report = OrderedDict()
+    _add_count(report, Model, 'delete', root.count())
+
+    try:
+        tree = relation_tree(Model)
+    except CollectorRequired:
+        collector = Collector(using=root.db)  # it has to load the objects anyway
+        try:
+            collector.collect(root)
+        except (ProtectedError, RestrictedError) as e:
+            # the collector stops at the protected relations, only they are known
+            for obj in e.protected_objects if isinstance(e, ProtectedError) else e.restricted_objects:
+                _add_count(report, type(obj), 'protect', 1)
+            return _report(report)
+        for RelatedModel, instances in collector.data.items():
+            if RelatedModel != Model:
+                _add_count(report, RelatedModel, 'delete', len(instances))
+        for related_queryset in collector.fast_deletes:
+            _add_count(report, related_queryset.model, 'delete', related_queryset.count())
+        for RelatedModel, updates in collector.field_updates.items():
+            _add_count(report, RelatedModel, 'set_null', sum(len(instances) for instances in updates.values()))
+        return _report(report)
+
+    for field, action, related_queryset in cascade_steps(tree, root):
+        _add_count(report, field.model, action, related_queryset.count())
+    return _report(report)
+
+
+def _raise_if_protected(Model, field, related_queryset):
+    protected = list(related_queryset[:1])
+    if protected:
+        raise ProtectedError(
+            f"Cannot delete some {model_to_str(Model)} objects, they are referenced by "
+            f"the protected foreign key {model_to_str(field.model)}.{field.name}.",
+            set(protected),
+        )
+
+
+def check_protected(queryset, tree):
+    """Raise a ProtectedError (or RestrictedError) if deleting the queryset is prevented by any row."""
+    if tree is None:
+        Collector(using=queryset.db).collect(queryset)  # raises for protected objects
+        return
+
+    for field, action, related_queryset in cascade_steps(tree, queryset):
+        if action == 'protect':
+            _raise_if_protected(queryset.model, field, related_queryset)
+
+
+def _delete_chunk(Model, pks, tree, report):
+    chunk = Model._base_manager.filter(pk__in=pks)
+
+    if tree is None:
+        _, counts = chunk.delete()
+        for label, count in counts.items():
+            report[(label, 'delete')] = report.get((label, 'delete'), 0) + count
+        return
+
+    for field, action, related_queryset in cascade_steps(tree, chunk):
+        if action == 'protect':
+            _raise_if_protected(Model, field, related_queryset)  # referenced since the check of the whole queryset
+        elif action == 'set_null':
+            _add_count(report, field.model, action, related_queryset.update(**{field.name: None}))
+        else:
+            _add_count(report, field.model, action, related_queryset._raw_delete(related_queryset.db))
+
+    _add_count(report, Model, 'delete', chunk._raw_delete(chunk.db))
+
+
+def delete_in_chunks(queryset, chunk_size):
+    """
+    Delete the queryset `chunk_size` objects at a time, every chunk with its cascades in a transaction of
+    its own. Cascades run as set-based DELETE / UPDATE statements per relation when no signals have to be
+    sent, otherwise every chunk goes through Django's Collector. Returns the rows affected per model like
+    estimate_deletion.
+
+    Protected relations are checked for the whole queryset before the first chunk, so a protected object
+    doesn't stop the deletion halfway (the Collector check loads all objects at once).
+    """
+    Model = queryset.model
+    report = OrderedDict([((model_to_str(Model), 'delete'), 0)])
+
+    try:
+        tree = relation_tree(Model)
+    except CollectorRequired:
+        tree = None
+
+    check_protected(Model._base_manager.filter(pk__in=queryset.values('pk')), tree)
+
+    pks = queryset.values_list('pk', flat=True).order_by('pk')
+    while True:
+        chunk = list(pks[:chunk_size])  # deleted rows drop out of the queryset, take the next chunk from the top
+        if not chunk:
+            break
+        with transaction.atomic(using=queryset.db):
+            _delete_chunk(Model, chunk, tree, report)
+
+    return _report(report)